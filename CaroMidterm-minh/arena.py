@@ -0,0 +1,225 @@
+"""Engine-vs-engine matches without the pygame window
+
+    python arena.py --games 200 --a depth=4,time=200 --b depth=2,evaluator=numpy --out games.jsonl
+
+Engines are written as key=value lists:
+    level      0 (random) or 1 (minimax)               default 1
+    depth      deepest iteration (max_depth of eval)   default AI_MAX_DEPTH
+    time       time budget per move in ms, 0 = none    default AI_TIME_BUDGET_MS
+    evaluator  incremental, numpy or python            default incremental
+    candidates moves searched per node                 default 10
+    book       opening book file (book.py), '' = none   default ''
+    threats    threat search node budget, 0 = off      default 3000
+    weights    evaluation weights file (tune.py), '' = built in   default ''
+    quiescence forcing-move nodes per leaf, 0 = off    default 64
+    search     minimax or pvs                          default minimax
+    lmr        pvs reduces moves from this index, 0 = off   default 3
+
+Engine A plays X in even games and O in odd games. Results replace the --out
+file: one game per line (.jsonl, moves as [row, col] pairs), one move per
+row (.csv) or game records (.rec, see records.py) for tune.py.
+--rows, --cols and --win-length play on other boards, e.g. 15x15 Gomoku.
+"""
+import argparse
+import csv
+import json
+import math
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from constants import AI_MAX_DEPTH, AI_TIME_BUDGET_MS, BOARD_BACKEND, ROWS, COLS, WIN_LENGTH
+from book import open_book
+from engine import AI, load_weights, new_board
+from records import GameRecorder, DRAW
+
+ENGINE_DEFAULTS = {
+    'level': 1,
+    'depth': AI_MAX_DEPTH,
+    'time': AI_TIME_BUDGET_MS,
+    'evaluator': 'incremental',
+    'candidates': 10,
+    'book': '',
+    'threats': 3000,  # threat search node budget, 0 = off
+    'weights': '',
+    'quiescence': 64,  # forcing-move nodes per leaf, 0 = off
+    'search': 'minimax',
+    'lmr': 3,  # pvs late move reductions from this move on, 0 = off
+}
+
+
+def parse_engine(text):
+    """'depth=4,time=200' -> full engine settings"""
+    engine = dict(ENGINE_DEFAULTS)
+    for item in filter(None, text.split(',')):
+        key, _, value = item.partition('=')
+        if key not in engine:
+            raise argparse.ArgumentTypeError(f"unknown engine setting {key!r}")
+        engine[key] = int(value) if isinstance(ENGINE_DEFAULTS[key], int) else value
+    return engine
+
+
+def make_ai(engine, player, shape=(ROWS, COLS, WIN_LENGTH)):
+    rows, cols, win_length = shape
+    return AI(level=engine['level'], player=player, evaluator=engine['evaluator'],
+              max_candidates=engine['candidates'], time_budget_ms=engine['time'] or None,
+              rows=rows, cols=cols, win_length=win_length, book=open_book(engine['book']),
+              threat_nodes=engine['threats'], weights=load_weights(engine['weights']),
+              quiescence_nodes=engine['quiescence'], search=engine['search'], lmr_moves=engine['lmr'])
+
+# --- GAMES ---
+
+
+def play_game(game_id, engine_a, engine_b, seed, opening_plies, backend=BOARD_BACKEND, shape=(ROWS, COLS, WIN_LENGTH)):
+    """Play one game in a worker and return its record"""
+    rng = random.Random(seed * 1_000_003 + game_id)
+    random.seed(rng.random())  # AI.eval's random opening square
+
+    # Engine A is X (1) in even games
+    engines = {1: engine_a, 2: engine_b} if game_id % 2 == 0 else {1: engine_b, 2: engine_a}
+    names = {1: 'a', 2: 'b'} if game_id % 2 == 0 else {1: 'b', 2: 'a'}
+    ais = {player: make_ai(engine, player, shape) for player, engine in engines.items()}
+    board = new_board(backend, *shape)
+
+    moves, times_ms, nodes, depths = [], [], [], []
+    player = 1
+    while board.final_state() == 0 and not board.isfull():
+        if len(moves) < opening_plies:
+            # Random moves near the center so the games differ
+            move = rng.choice([(r, c) for r, c in board.geometry.center_moves if board.empty_sqr(r, c)])
+            elapsed, searched, depth = 0.0, 0, 0
+        else:
+            ai = ais[player]
+            ai.nodes = ai.depth_reached = 0
+            start = time.perf_counter()
+            move = ai.eval(board, engines[player]['depth'])
+            elapsed = (time.perf_counter() - start) * 1000
+            searched, depth = ai.nodes, ai.depth_reached
+            if move is None or not board.empty_sqr(*move):
+                move = rng.choice(board.get_empty_sqrs())
+
+        board.mark_sqr(move[0], move[1], player)
+        moves.append(move)
+        times_ms.append(round(elapsed, 2))
+        nodes.append(searched)
+        depths.append(depth)
+        player = player % 2 + 1
+
+    winner = board.final_state()
+    return {
+        'game': game_id,
+        'rows': board.rows,
+        'cols': board.cols,
+        'win_length': board.geometry.win_length,
+        'x': names[1],
+        'o': names[2],
+        'winner': names[winner] if winner else 'draw',
+        'plies': len(moves),
+        'moves': [list(move) for move in moves],
+        'ms': times_ms,
+        'nodes': nodes,
+        'depth': depths,
+    }
+
+# --- RESULTS ---
+
+
+def write_results(path, games):
+    if path.endswith('.rec'):
+        # GameRecorder appends, but a match replaces its output like the other formats
+        open(path, 'wb').close()
+        recorder = GameRecorder(path)
+        for game in games:
+            recorder.begin(game['rows'], game['cols'], game['win_length'])
+            for row, col in game['moves']:
+                recorder.move(row, col)
+            winner = {game['x']: 1, game['o']: 2}.get(game['winner'], DRAW)
+            recorder.end(winner)
+        recorder.close()
+    elif path.endswith('.csv'):
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['game', 'ply', 'engine', 'row', 'col', 'ms', 'nodes', 'depth', 'winner'])
+            for game in games:
+                for ply in range(game['plies']):
+                    engine = game['x'] if ply % 2 == 0 else game['o']
+                    row, col = game['moves'][ply]
+                    writer.writerow([game['game'], ply, engine, row, col,
+                                     game['ms'][ply], game['nodes'][ply], game['depth'][ply], game['winner']])
+    else:
+        with open(path, 'w') as f:
+            for game in games:
+                f.write(json.dumps(game, separators=(',', ':')) + '\n')
+
+
+def elo(score):
+    """Elo difference for an expected score in (0, 1)"""
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def summary(games):
+    """Win/draw/loss of engine A, its score and Elo difference with 95% intervals"""
+    wins = sum(game['winner'] == 'a' for game in games)
+    losses = sum(game['winner'] == 'b' for game in games)
+    draws = len(games) - wins - losses
+    n = len(games)
+    score = (wins + draws / 2) / n
+
+    # Normal approximation over the per-game points 1, 1/2, 0
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / n
+    margin = 1.96 * math.sqrt(variance / n)
+    return {
+        'games': n,
+        'wins': wins,
+        'draws': draws,
+        'losses': losses,
+        'score': score,
+        'score_ci': (max(score - margin, 0.0), min(score + margin, 1.0)),
+        'elo': elo(score),
+        'elo_ci': (elo(score - margin), elo(score + margin)),
+    }
+
+
+def run(n_games, engine_a, engine_b, workers, seed=0, opening_plies=2, backend=BOARD_BACKEND,
+        shape=(ROWS, COLS, WIN_LENGTH)):
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(play_game, game_id, engine_a, engine_b, seed, opening_plies, backend, shape)
+                   for game_id in range(n_games)]
+        return [future.result() for future in futures]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--a', type=parse_engine, default=parse_engine(''), help='engine A settings')
+    parser.add_argument('--b', type=parse_engine, default=parse_engine(''), help='engine B settings')
+    parser.add_argument('--workers', type=int, default=None, help='processes, default one per CPU')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--opening-plies', type=int, default=2, help='random moves before the engines play')
+    parser.add_argument('--backend', default=BOARD_BACKEND, choices=['array', 'bitboard'])
+    parser.add_argument('--rows', type=int, default=ROWS)
+    parser.add_argument('--cols', type=int, default=COLS)
+    parser.add_argument('--win-length', type=int, default=WIN_LENGTH)
+    parser.add_argument('--out', default='arena.jsonl', help='.jsonl (one game per line), .csv (one move per row) or .rec (game records)')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    games = run(args.games, args.a, args.b, args.workers, args.seed, args.opening_plies, args.backend,
+                (args.rows, args.cols, args.win_length))
+    seconds = time.perf_counter() - start
+    write_results(args.out, games)
+
+    result = summary(games)
+    plies = sum(game['plies'] for game in games)
+    print(f"A: {args.a}")
+    print(f"B: {args.b}")
+    print(f"{result['games']} games in {seconds:.1f}s ({result['games'] / seconds * 3600:.0f} games/hour, "
+          f"{plies / seconds:.1f} moves/s)")
+    print(f"A +{result['wins']} ={result['draws']} -{result['losses']}  "
+          f"score {result['score']:.3f} [{result['score_ci'][0]:.3f}, {result['score_ci'][1]:.3f}]  "
+          f"Elo {result['elo']:+.0f} [{result['elo_ci'][0]:+.0f}, {result['elo_ci'][1]:+.0f}]")
+    print(f"results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
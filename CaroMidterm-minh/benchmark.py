@@ -0,0 +1,377 @@
+"""Benchmarks for the AI hot paths
+
+    python benchmark.py run --out before.json       # fixed positions, all metrics
+    python benchmark.py compare before.json after.json
+    python benchmark.py eval --positions 200        # evaluators against each other
+    python benchmark.py search --depth 5            # minimax against pvs, same positions and depth
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+import numpy as np
+from engine import Board, AI, new_board
+
+# --- POSITIONS ---
+
+# Moves are digit pairs (row, col) played alternately from X (1). 'expect'
+# lists the squares a correct engine must play: a win of the side to move
+# or the block of the opponent's five.
+POSITIONS = [
+    {'name': 'empty', 'kind': 'opening', 'moves': ''},
+    {'name': 'opening-1', 'kind': 'opening', 'moves': '44'},
+    {'name': 'opening-4', 'kind': 'opening', 'moves': '44455534'},
+    {'name': 'midgame-12', 'kind': 'midgame', 'moves': '435534652552455644545346'},
+    {'name': 'midgame-13', 'kind': 'midgame', 'moves': '34354556444624544355140457'},
+    {'name': 'midgame-16', 'kind': 'midgame', 'moves': '43553465255245564454534633633562'},
+    {'name': 'win-row', 'kind': 'win', 'moves': '4400450946904799', 'expect': ['43', '48']},
+    {'name': 'win-diag', 'kind': 'win', 'moves': '2209331944295599', 'expect': ['11', '66']},
+    {'name': 'win-over-block', 'kind': 'win', 'moves': '5080518152825383', 'expect': ['54']},
+    {'name': 'block-col', 'kind': 'block', 'moves': '22993297429552', 'expect': ['12', '62']},
+    {'name': 'block-antidiag', 'kind': 'block', 'moves': '27003602450454', 'expect': ['18', '63']},
+    {'name': 'block-midgame', 'kind': 'block', 'moves': '4655355744565358', 'expect': ['54']},
+]
+
+
+def load_position(position, backend='array'):
+    """Board of a POSITIONS entry and the player to move"""
+    board = new_board(backend)
+    moves = position['moves']
+    player = 1
+    for i in range(0, len(moves), 2):
+        board.mark_sqr(int(moves[i]), int(moves[i + 1]), player)
+        player = player % 2 + 1
+    return board, player
+
+
+def random_board(rng, n_moves):
+    """Play n_moves random moves, stopping early if someone wins"""
+    board = Board()
+    player = 1
+    for _ in range(n_moves):
+        row, col = rng.choice(board.get_empty_sqrs())
+        board.mark_sqr(row, col, player)
+        player = player % 2 + 1
+        if board.final_state() != 0:
+            break
+    return board
+
+
+def time_calls(func, boards, repeat):
+    """Seconds per call of func over every board"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for board in boards:
+            func(board)
+    return (time.perf_counter() - start) / (repeat * len(boards))
+
+
+def fastest(repeat, func):
+    """(seconds, result) of the fastest of repeat calls of func"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best[0]:
+            best = (seconds, result)
+    return best
+
+
+def per_call(func, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls
+
+# --- SUITE ---
+
+
+def bench_search(board, player, depth, repeat):
+    """Iterative deepening to a fixed depth: time to depth, branching, pruning"""
+    def search():
+        ai = AI(player=player)
+        ai.iterative_deepening(board, depth)
+        return ai
+    seconds, ai = fastest(repeat, search)
+
+    # ai.iterations holds the running node count after every depth
+    per_depth = [nodes - previous for (_, _, nodes), (_, _, previous)
+                 in zip(ai.iterations, [(0, 0, 0)] + ai.iterations)]
+    interior = ai.nodes - ai.leaves
+    result = {
+        'ms': seconds * 1000,
+        'nodes': ai.nodes,
+        'nodes_per_sec': ai.nodes / seconds,
+        'time_to_depth': [{'depth': d, 'ms': s * 1000, 'nodes': n} for d, s, n in ai.iterations],
+        # Nodes of the last iteration over nodes of the one before
+        'branching_factor': per_depth[-1] / per_depth[-2] if len(per_depth) > 1 and per_depth[-2] else None,
+        # Share of interior nodes that stopped on an alpha-beta cutoff
+        'prune_rate': ai.cutoffs / interior if interior else None,
+    }
+
+    # Peak Python/NumPy allocations of one search; the table is allocated before
+    ai = AI(player=player)
+    tracemalloc.start()
+    ai.iterative_deepening(board, depth)
+    result['peak_kb'] = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+    return result
+
+
+def bench_position(position, depth, repeat, backend):
+    board, player = load_position(position, backend)
+    result = {'kind': position['kind'], 'plies': board.marked_sqrs}
+
+    # AI.eval as the game calls it: win/block checks, then iterative deepening
+    def move():
+        ai = AI(player=player)
+        return ai, ai.eval(board, depth)
+    seconds, (ai, (row, col)) = fastest(repeat, move)
+    result['eval'] = {
+        'ms': seconds * 1000,
+        'move': f'{row}{col}',
+        'depth': ai.depth_reached,
+        'nodes': ai.nodes,
+    }
+    if 'expect' in position:
+        result['eval']['correct'] = result['eval']['move'] in position['expect']
+        # The shortcut has to see the win, or the opponent's win to block
+        side = player if position['kind'] == 'win' else player % 2 + 1
+        found = AI(player=player).find_winning_move(board, side)
+        result['find_winning_move'] = {'correct': found is not None and f'{found[0]}{found[1]}' in position['expect']}
+
+    if not board.isempty() and board.final_state() == 0:
+        result['search'] = bench_search(board, player, depth, repeat)
+
+        # A single fixed-depth minimax call with an empty table
+        def minimax():
+            ai = AI(player=player)
+            ai.minimax(board, True, 0, depth)
+            return ai
+        seconds, ai = fastest(repeat, minimax)
+        result['minimax'] = {'ms': seconds * 1000, 'nodes': ai.nodes, 'nodes_per_sec': ai.nodes / seconds}
+
+    # The per-node primitives
+    row, col = board.get_empty_sqrs()[0]
+
+    def push_pop():
+        board.push(row, col, player)
+        board.pop()
+    result['final_state_ns'] = per_call(board.final_state, 10000) * 1e9
+    result['push_pop_us'] = per_call(push_pop, 1000) * 1e6
+
+    ai = AI(player=player)
+    for evaluator in ('numpy', 'incremental'):
+        ai.evaluator = evaluator
+        ai.evaluate_board(board)  # attaches the incremental score
+        result[f'evaluate_{evaluator}_us'] = per_call(lambda: ai.evaluate_board(board), 1000) * 1e6
+    return result
+
+
+def run_suite(depth=4, repeat=3, backend='array'):
+    results = {
+        'meta': {
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'depth': depth,
+            'repeat': repeat,
+            'backend': backend,
+        },
+        'positions': {},
+    }
+    for position in POSITIONS:
+        result = bench_position(position, depth, repeat, backend)
+        results['positions'][position['name']] = result
+
+        line = f"{position['name']:<15} eval {result['eval']['ms']:7.1f} ms {result['eval']['move']}"
+        if 'expect' in position:
+            line += ' ok   ' if result['eval']['correct'] and result['find_winning_move']['correct'] else ' WRONG'
+        else:
+            line += ' ' * 6
+        search = result.get('search')
+        if search:
+            line += f"  depth {depth} {search['ms']:7.1f} ms {search['nodes_per_sec']:6.0f} nodes/s"
+            if search['branching_factor'] is not None:
+                line += f"  ebf {search['branching_factor']:4.1f}"
+            if search['prune_rate'] is not None:
+                line += f"  prune {search['prune_rate']:.2f}"
+            line += f"  peak {search['peak_kb']:.0f} KB"
+        print(line)
+    return results
+
+# --- COMPARE ---
+
+# (path into a position's results, True if higher is better)
+COMPARED = [
+    (('eval', 'ms'), False),
+    (('search', 'ms'), False),
+    (('search', 'nodes_per_sec'), True),
+    (('search', 'peak_kb'), False),
+    (('minimax', 'ms'), False),
+    (('minimax', 'nodes_per_sec'), True),
+    (('final_state_ns',), False),
+    (('push_pop_us',), False),
+    (('evaluate_numpy_us',), False),
+    (('evaluate_incremental_us',), False),
+]
+
+
+def lookup(result, path):
+    for key in path:
+        if not isinstance(result, dict) or key not in result:
+            return None
+        result = result[key]
+    return result
+
+
+def compare(old, new, threshold=0.10):
+    """Print what got worse between two runs and return it"""
+    regressions = []
+    for name, after_result in new['positions'].items():
+        before_result = old['positions'].get(name)
+        if before_result is None:
+            continue
+
+        for path, higher_is_better in COMPARED:
+            before, after = lookup(before_result, path), lookup(after_result, path)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append(f"{name} {'.'.join(path)} {before:.4g} -> {after:.4g} ({change:+.0%})")
+
+        # A tactic that was found must still be found
+        for path in (('eval', 'correct'), ('find_winning_move', 'correct')):
+            if lookup(before_result, path) and lookup(after_result, path) is False:
+                regressions.append(f"{name} {'.'.join(path)} no longer finds the move")
+
+    for regression in regressions:
+        print('REGRESSION', regression)
+    if not regressions:
+        print(f"no regressions beyond {threshold:.0%}")
+    return regressions
+
+# --- EVALUATION ---
+
+
+def bench_evaluate(n_positions=200, repeat=5, seed=0):
+    rng = random.Random(seed)
+    boards = [random_board(rng, rng.randint(0, 60)) for _ in range(n_positions)]
+    ai = AI(player=2)
+
+    # The evaluators must agree exactly before their speed means anything
+    for board in boards:
+        expected = ai.evaluate_board_python(board)
+        for evaluator in ('numpy', 'incremental'):
+            ai.evaluator = evaluator
+            actual = ai.evaluate_board(board)
+            if actual != expected:
+                raise AssertionError(f"{evaluator} evaluator gave {actual}, expected {expected}")
+
+    # The incremental score is already attached to the boards here, so this
+    # times the leaf lookup; the update cost is paid in Board.push/pop
+    results = {}
+    for evaluator in ('python', 'numpy', 'incremental'):
+        ai.evaluator = evaluator
+        results[evaluator] = time_calls(ai.evaluate_board, boards, repeat)
+
+    for evaluator, seconds in results.items():
+        speedup = results['python'] / seconds
+        print(f"evaluate_board {evaluator:<12} {seconds * 1e6:8.1f} us/call {speedup:7.1f}x")
+    return results
+
+
+# --- SEARCHES ---
+
+# (name, AI options) of the searches compared, the first is the reference
+SEARCHES = [
+    ('minimax', {'search': 'minimax'}),
+    ('pvs', {'search': 'pvs', 'lmr_moves': 0}),
+    ('pvs+lmr', {'search': 'pvs'}),
+]
+
+
+def bench_searches(depth=5, n_random=20, seed=0):
+    """Every search to the same depth on the same positions: time, nodes and the moves minimax also plays"""
+    positions = [load_position(position) for position in POSITIONS if position['moves']]
+    rng = random.Random(seed)
+    while len(positions) < len(POSITIONS) - 1 + n_random:
+        board = random_board(rng, rng.randint(6, 30))
+        if board.final_state() == 0:
+            positions.append((board, board.marked_sqrs % 2 + 1))
+
+    results = {}
+    for name, options in SEARCHES:
+        start = time.perf_counter()
+        nodes = researches = 0
+        moves = []
+        for board, player in positions:
+            ai = AI(player=player, **options)
+            moves.append(ai.iterative_deepening(board, depth))
+            nodes += ai.nodes
+            researches += ai.researches
+        results[name] = {'ms': (time.perf_counter() - start) * 1000, 'nodes': nodes, 'researches': researches,
+                         'moves': moves}
+
+    reference = results[SEARCHES[0][0]]
+    for name, result in results.items():
+        same = sum(move == expected for move, expected in zip(result['moves'], reference['moves']))
+        result['same_moves'] = same
+        print(f"{name:<8} depth {depth} {result['ms']:8.1f} ms {result['nodes']:8d} nodes "
+              f"({result['nodes'] / reference['nodes']:.2f}x) {result['researches']:5d} re-searches  "
+              f"same move as {SEARCHES[0][0]} {same}/{len(positions)}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='bench', required=True)
+
+    run = commands.add_parser('run', help='time the fixed positions and write the results as JSON')
+    run.add_argument('--depth', type=int, default=4)
+    run.add_argument('--repeat', type=int, default=3, help='keep the fastest of this many runs')
+    run.add_argument('--backend', default='array', choices=['array', 'bitboard'])
+    run.add_argument('--out', default='benchmark.json')
+
+    diff = commands.add_parser('compare', help='exit with 1 if the new run regressed')
+    diff.add_argument('old')
+    diff.add_argument('new')
+    diff.add_argument('--threshold', type=float, default=0.10, help='relative change counted as a regression')
+
+    evaluate = commands.add_parser('eval', help='the evaluators on random positions')
+    evaluate.add_argument('--positions', type=int, default=200)
+    evaluate.add_argument('--repeat', type=int, default=5)
+    evaluate.add_argument('--seed', type=int, default=0)
+
+    searches = commands.add_parser('search', help='minimax and pvs on the same positions')
+    searches.add_argument('--depth', type=int, default=5)
+    searches.add_argument('--random', type=int, default=20, help='random positions added to the fixed ones')
+    searches.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args()
+    if args.bench == 'run':
+        results = run_suite(args.depth, args.repeat, args.backend)
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=1)
+        print(f"results written to {args.out}")
+    elif args.bench == 'compare':
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        if compare(old, new, args.threshold):
+            sys.exit(1)
+    elif args.bench == 'search':
+        bench_searches(args.depth, args.random, args.seed)
+    else:
+        bench_evaluate(args.positions, args.repeat, args.seed)
+
+
+if __name__ == "__main__":
+    main()
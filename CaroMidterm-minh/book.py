@@ -0,0 +1,203 @@
+"""Opening book: best moves of the first plies, searched offline
+
+    python book.py build --plies 5 --width 3 --time 1000 --out opening_book.bin
+    python book.py show opening_book.bin
+
+Positions are keyed by their canonical Zobrist hash (Board.canonical_hash),
+so one entry serves all rotations and reflections of a position. The file
+is a header followed by the sorted keys and the moves, scores and depths
+as flat arrays; OpeningBook maps it and looks keys up without copying it.
+"""
+import argparse
+import mmap
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from constants import AI_MAX_DEPTH, ROWS, COLS, WIN_LENGTH
+from engine import AI, geometry, new_board
+from transposition import ZOBRIST_SEED
+
+MAGIC = b'CAROBOOK'
+VERSION = 1
+# magic, version, rows, cols, win length, deepest ply, zobrist seed, entries
+HEADER = struct.Struct('<8sHHHHH6xQQ')
+
+
+def open_book(path):
+    """The book at path, or None if there is no such file"""
+    if path and os.path.exists(path):
+        return OpeningBook(path)
+    return None
+
+
+class OpeningBook:
+    """Read-only book mapped from a file built by build_book"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, rows, cols, win_length, self.max_plies, seed, n = HEADER.unpack_from(self.mmap)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} opening book")
+        if seed != ZOBRIST_SEED:
+            raise ValueError(f"{path} was built with other Zobrist keys")
+        self.geometry = geometry(rows, cols, win_length)
+
+        # Views into the mapped file, the OS pages them in on first use
+        offset = HEADER.size
+        self.keys = np.frombuffer(self.mmap, '<u8', n, offset)
+        offset += 8 * n
+        self.moves = np.frombuffer(self.mmap, '<u2', n, offset)
+        offset += 2 * n
+        self.scores = np.frombuffer(self.mmap, '<i2', n, offset)
+        offset += 2 * n
+        self.depths = np.frombuffer(self.mmap, 'u1', n, offset)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def close(self):
+        self.keys = self.moves = self.scores = self.depths = None
+        self.mmap.close()
+
+    def probe(self, board):
+        """
+            @return (move, score, depth) for the side to move on board
+            @return None if the position is not in the book
+        """
+        if board.geometry is not self.geometry or board.marked_sqrs > self.max_plies:
+            return None
+        key, symmetry = board.canonical_hash()
+        i = int(np.searchsorted(self.keys, np.uint64(key)))
+        if i == len(self.keys) or int(self.keys[i]) != key:
+            return None
+
+        # The move is stored for the canonical orientation, turn it back
+        cell = self.geometry.inverse_symmetries[symmetry][int(self.moves[i])]
+        move = divmod(cell, self.geometry.cols)
+        if not board.empty_sqr(*move):
+            return None  # a hash collision
+        return move, int(self.scores[i]), int(self.depths[i])
+
+    def lookup(self, board):
+        entry = self.probe(board)
+        return entry[0] if entry else None
+
+# --- BUILDING ---
+
+
+def write_book(path, entries, shape, max_plies):
+    """entries: {canonical key: (canonical move cell, score, depth)}"""
+    keys = np.array(sorted(entries), dtype='<u8')
+    values = [entries[key] for key in keys.tolist()]
+    rows, cols, win_length = shape
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, rows, cols, win_length, max_plies, ZOBRIST_SEED, len(keys)))
+        f.write(keys.tobytes())
+        f.write(np.array([value[0] for value in values], dtype='<u2').tobytes())
+        f.write(np.array([value[1] for value in values], dtype='<i2').tobytes())
+        f.write(np.array([value[2] for value in values], dtype='u1').tobytes())
+
+
+def replay(moves, shape):
+    board = new_board('array', *shape)
+    player = 1
+    for row, col in moves:
+        board.mark_sqr(row, col, player)
+        player = player % 2 + 1
+    return board, player
+
+
+def _search_position(moves, shape, max_depth, time_budget_ms, width):
+    """Search one book position in a worker: (moves, best move, score, depth, replies to expand)"""
+    board, player = replay(moves, shape)
+    rows, cols, win_length = shape
+    ai = AI(player=player, time_budget_ms=time_budget_ms, rows=rows, cols=cols, win_length=win_length)
+    move = ai.iterative_deepening(board, max_depth, time_budget_ms)
+    entry = ai.tt.probe(ai.position_key(board, True)[0], 0)
+    score = max(-32768, min(32767, entry[2])) if entry else 0
+
+    if board.isempty():
+        # The game opens on a random center square, the book has to answer all of them
+        replies = list(board.geometry.center_moves)
+    else:
+        replies = [move] + [reply for reply in ai.get_strategic_moves(board, player, 0) if reply != move]
+        replies = replies[:width]
+    return moves, move, score, ai.depth_reached, replies
+
+
+def build_book(plies=5, width=3, max_depth=AI_MAX_DEPTH, time_budget_ms=1000,
+               shape=(ROWS, COLS, WIN_LENGTH), workers=None):
+    """
+        Search every position of the first plies of play, expanding the
+        width best replies of each, and return {canonical key: entry}
+    """
+    entries = {}
+    frontier = [[]]
+    with ProcessPoolExecutor(workers) as pool:
+        for ply in range(plies):
+            start = time.perf_counter()
+            # One search per position, whatever its orientation
+            unique = {}
+            for moves in frontier:
+                board, _ = replay(moves, shape)
+                if board.final_state() != 0:
+                    continue
+                key, _ = board.canonical_hash()
+                if key not in entries and key not in unique:
+                    unique[key] = moves
+
+            frontier = []
+            futures = [pool.submit(_search_position, moves, shape, max_depth, time_budget_ms, width)
+                       for moves in unique.values()]
+            for future in futures:
+                moves, move, score, depth, replies = future.result()
+                board, _ = replay(moves, shape)
+                key, symmetry = board.canonical_hash()
+                cell = board.geometry.symmetries[symmetry][move[0] * board.cols + move[1]]
+                entries[key] = (cell, score, depth)
+                frontier.extend(moves + [reply] for reply in replies)
+
+            print(f"ply {ply}: {len(unique)} positions in {time.perf_counter() - start:.1f}s, {len(entries)} in the book")
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='search the opening positions and write a book')
+    build.add_argument('--plies', type=int, default=5, help='positions with fewer stones get an entry')
+    build.add_argument('--width', type=int, default=3, help='replies expanded per position')
+    build.add_argument('--depth', type=int, default=AI_MAX_DEPTH)
+    build.add_argument('--time', type=int, default=1000, help='search time per position in ms')
+    build.add_argument('--rows', type=int, default=ROWS)
+    build.add_argument('--cols', type=int, default=COLS)
+    build.add_argument('--win-length', type=int, default=WIN_LENGTH)
+    build.add_argument('--workers', type=int, default=None, help='processes, default one per CPU')
+    build.add_argument('--out', default='opening_book.bin')
+
+    show = commands.add_parser('show', help='print the entries of a book')
+    show.add_argument('path')
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        shape = (args.rows, args.cols, args.win_length)
+        entries = build_book(args.plies, args.width, args.depth, args.time, shape, args.workers)
+        write_book(args.out, entries, shape, args.plies - 1)
+        print(f"{len(entries)} positions written to {args.out} ({os.path.getsize(args.out)} bytes)")
+    else:
+        book = OpeningBook(args.path)
+        geometry = book.geometry
+        print(f"{len(book)} positions, {geometry.rows}x{geometry.cols}, {geometry.win_length} in a row, "
+              f"up to {book.max_plies} stones")
+        for key, cell, score, depth in zip(book.keys.tolist(), book.moves.tolist(),
+                                           book.scores.tolist(), book.depths.tolist()):
+            print(f"{key:016x} {divmod(cell, geometry.cols)} score {score} depth {depth}")
+        book.close()
+
+
+if __name__ == "__main__":
+    main()
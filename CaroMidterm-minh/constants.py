@@ -9,7 +9,8 @@ HEIGHT = 600
 
 ROWS = 10  # 10x10 board
 COLS = 10  # 10x10 board
-SQSIZE = WIDTH // COLS  # Square size for 10x10 (60px per square)
+WIN_LENGTH = 5  # stones in a row that win
+SQSIZE = WIDTH // COLS  # Square size (60px per square on 10x10)
 
 LINE_WIDTH = 7  # Thinner lines for smaller squares
 CIRC_WIDTH = 5  # Thinner circles
@@ -24,4 +25,18 @@ OFFSET = 15  # Smaller offset for better visibility in smaller squares
 BG_COLOR = (28, 170, 156)
 LINE_COLOR = (23, 145, 135)
 CIRC_COLOR = (239, 231, 200)  # Light cream color for O
-CROSS_COLOR = (66, 66, 66)    # Dark gray for X
\ No newline at end of file
+CROSS_COLOR = (66, 66, 66)    # Dark gray for X
+
+# --- AI ---
+
+AI_TIME_BUDGET_MS = 1000  # Thinking time per AI move
+AI_MAX_DEPTH = 10  # Deepest iteration the AI will search
+AI_PONDER = True  # Search the likely replies while the human thinks
+AI_MIN_DISPLAY_MS = 300  # An AI move is shown no sooner than this after its turn starts
+FPS = 60  # Frame cap of the game loop, leaves the CPU to the AI's search thread
+
+BOARD_BACKEND = 'array'  # 'array' (NumPy squares) or 'bitboard' (int bitmasks)
+
+OPENING_BOOK = 'opening_book.bin'  # built by book.py, played without it if missing
+GAME_RECORDS = 'games.rec'  # every game is appended here (records.py), '' = not recorded
+EVAL_WEIGHTS = 'eval_weights.json'  # written by tune.py, the built-in weights if missing
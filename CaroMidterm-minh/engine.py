@@ -0,0 +1,1293 @@
+"""
+    Headless Caro engine: boards and the minimax AI.
+    Imports neither pygame nor tkinter, so it can be used from worker
+    processes, tests and servers.
+"""
+import json
+import os
+import time
+import random
+import threading
+from functools import lru_cache
+from operator import itemgetter, xor
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from constants import BOARD_BACKEND, ROWS, COLS, WIN_LENGTH
+from stats import SearchStats
+from threats import ThreatSolver, WIN, fours, open_fours, wins
+from transposition import TranspositionTable, zobrist_keys, SIDE_KEYS, EXACT, LOWER, UPPER, WIN_SCORE
+
+# --- WINDOWS ---
+
+def window_cells(rows=ROWS, cols=COLS, win_length=WIN_LENGTH):
+    """Flat square indices of every win_length window, one row per window"""
+    grid = np.arange(rows * cols).reshape(rows, cols)
+    size = (win_length, win_length)
+    # Same direction order as Board.check_win
+    return np.concatenate((
+        sliding_window_view(grid, win_length, axis=0).reshape(-1, win_length),  # columns
+        sliding_window_view(grid, win_length, axis=1).reshape(-1, win_length),  # rows
+        sliding_window_view(grid, size).diagonal(axis1=2, axis2=3).reshape(-1, win_length),  # descending
+        sliding_window_view(grid[::-1], size).diagonal(axis1=2, axis2=3).reshape(-1, win_length),  # ascending
+    ))
+
+CENTER_VALUE = 3  # bonus for each stone on a center square
+
+# Evaluation weights; tune.py fits them to game results (EVAL_WEIGHTS in constants.py).
+# 'window': score of a window holding win_length - 3, - 2, - 1 and win_length
+# stones of one side and none of the other, 'center': CENTER_VALUE
+DEFAULT_WEIGHTS = {'window': [10, 50, 500, 1000], 'center': CENTER_VALUE}
+
+def load_weights(path):
+    """The weights in a JSON file written by tune.py, or DEFAULT_WEIGHTS if there is no such file"""
+    if not path or not os.path.exists(path):
+        return DEFAULT_WEIGHTS
+    with open(path) as f:
+        weights = json.load(f)
+    return {'window': [int(round(w)) for w in weights['window']], 'center': int(round(weights['center']))}
+
+# --- THREATS ---
+
+# Value of playing into a window that already holds n of the mover's stones
+# and none of the opponent's (ATTACK), or n of the opponent's and none of
+# the mover's (DEFENSE). n = 4 wins or blocks a five, n = 3 makes or stops a
+# four, n = 2 a three; open shapes lie in several windows and add up.
+# Longer win lengths use the top of the scale for their longest lines.
+THREAT_ATTACK = [1, 8, 64, 512, 100000]
+THREAT_DEFENSE = [1, 6, 48, 400, 50000]
+
+def build_threat_table(player, win_length=WIN_LENGTH):
+    """threat_tables[player][key] - value for player of a window with window key key"""
+    base = win_length + 1
+    shift = win_length - len(THREAT_ATTACK)
+    table = [0] * (base * base)
+    for count1 in range(base):
+        for count2 in range(base - count1):
+            own, opp = (count1, count2) if player == 1 else (count2, count1)
+            if own < win_length and opp == 0:
+                table[count1 + base * count2] += THREAT_ATTACK[max(own - shift, 0)]
+            if opp < win_length and own == 0:
+                table[count1 + base * count2] += THREAT_DEFENSE[max(opp - shift, 0)]
+    return table
+
+# --- GEOMETRY ---
+
+class Geometry:
+    """
+        Index tables of one board size and win length. Built once per
+        (rows, cols, win_length) by geometry() and shared by every board
+        and AI of that size; squares are numbered row * cols + col.
+    """
+    def __init__(self, rows, cols, win_length):
+        if not 1 < win_length <= min(rows, cols):
+            raise ValueError(f"win length {win_length} doesn't fit a {rows}x{cols} board")
+        self.rows = rows
+        self.cols = cols
+        self.win_length = win_length
+        self.size = rows * cols
+        # A window's key is its player 1 stones + key_base * its player 2 stones
+        self.key_base = win_length + 1
+
+        self.window_cells = window_cells(rows, cols, win_length)
+        windows = self.window_cells.tolist()
+        self.window_squares = [[divmod(cell, cols) for cell in cells] for cells in windows]
+
+        # The middle 4x4 (5 wide on odd sides, the whole side if it is shorter) is worth CENTER_VALUE per stone
+        center_rows = range(max((rows - 4) // 2, 0), min((rows + 5) // 2, rows))
+        center_cols = range(max((cols - 4) // 2, 0), min((cols + 5) // 2, cols))
+        self.center_moves = [(row, col) for row in center_rows for col in center_cols]
+        self.center_cells = np.array([row * cols + col for row, col in self.center_moves])
+
+        # cell_windows[cell] - the windows (rows of window_cells) through a square
+        self.cell_windows = [[] for _ in range(self.size)]
+        for window, cells in enumerate(windows):
+            for cell in cells:
+                self.cell_windows[cell].append(window)
+
+        # Per window: bitmask of its squares, its end squares and its direction
+        # (the step between its flat indices: 1, cols, cols + 1 or 1 - cols)
+        self.window_masks = [sum(1 << cell for cell in cells) for cells in windows]
+        self.window_ends = [(divmod(cells[0], cols), divmod(cells[-1], cols)) for cells in windows]
+        self.window_directions = [cells[1] - cells[0] for cells in windows]
+
+        # cell_window_keys[cell](board.window_keys) - the keys of the windows through a square
+        self.cell_window_keys = [itemgetter(*windows) for windows in self.cell_windows]
+
+        # neighbours[cell] - the up to 8 squares around a square
+        self.neighbours = [[(row + dr) * cols + col + dc
+                            for dr in (-1, 0, 1) for dc in (-1, 0, 1)
+                            if (dr or dc) and 0 <= row + dr < rows and 0 <= col + dc < cols]
+                           for row in range(rows) for col in range(cols)]
+
+        self.zobrist_keys = zobrist_keys(rows, cols)
+        # cell_zobrist_keys[player][cell] - the same keys by flat square index
+        self.cell_zobrist_keys = [[key for keys in player_keys for key in keys] for player_keys in self.zobrist_keys]
+
+        # symmetries[s][cell] - where each rotation or reflection of the board
+        # moves a square, identity first; 8 on square boards, 4 otherwise
+        transforms = [
+            lambda row, col: (row, col),
+            lambda row, col: (rows - 1 - row, cols - 1 - col),  # half turn
+            lambda row, col: (rows - 1 - row, col),  # upside down
+            lambda row, col: (row, cols - 1 - col),  # mirrored
+        ]
+        if rows == cols:
+            transforms += [
+                lambda row, col: (col, rows - 1 - row),  # quarter turn
+                lambda row, col: (cols - 1 - col, row),  # three quarter turns
+                lambda row, col: (col, row),  # main diagonal
+                lambda row, col: (cols - 1 - col, rows - 1 - row),  # other diagonal
+            ]
+        self.symmetries = []
+        self.inverse_symmetries = []
+        for transform in transforms:
+            forward = [0] * self.size
+            for row in range(rows):
+                for col in range(cols):
+                    r, c = transform(row, col)
+                    forward[row * cols + col] = r * cols + c
+            inverse = [0] * self.size
+            for cell, image in enumerate(forward):
+                inverse[image] = cell
+            self.symmetries.append(forward)
+            self.inverse_symmetries.append(inverse)
+
+        # symmetric_keys[player][cell] - the key of a stone in every symmetry,
+        # so a board keeps the hashes of all its orientations at once
+        self.symmetric_keys = [[tuple(keys[cells[cell]] for cells in self.symmetries) for cell in range(self.size)]
+                               for keys in self.cell_zobrist_keys]
+
+        self.threat_tables = [None, build_threat_table(1, win_length), build_threat_table(2, win_length)]
+
+@lru_cache(maxsize=None)
+def geometry(rows=ROWS, cols=COLS, win_length=WIN_LENGTH):
+    return Geometry(rows, cols, win_length)
+
+# Ordering bonus of a killer move, above a three but below a four
+KILLER_BONUS = 300
+# History only breaks ties between moves with similar threats
+HISTORY_LIMIT = 60
+# Share of a move's time budget the threat search may spend before minimax
+THREAT_TIME_SHARE = 0.1
+# Quiescence nodes a minimax leaf may spend on forcing moves before it settles for evaluate_board
+QUIESCENCE_NODES = 64
+# Plies past the leaf in which a quiet side may still play its fours
+QUIESCENCE_FOUR_PLIES = 2
+# AI(search=...): 'minimax' is the plain alpha-beta, 'pvs' the negamax principal variation search
+SEARCHES = ('minimax', 'pvs')
+# Half width of the pvs root window around the previous iteration's score
+ASPIRATION_WINDOW = 100
+# pvs searches a ply shallower the moves from this index on, at nodes this many plies from the leaves
+LMR_MOVES = 3
+LMR_MIN_DEPTH = 3
+
+# --- CLASSES ---
+
+class SearchTimeout(Exception):
+    """Raised inside AI.minimax when the time budget runs out"""
+
+class BoardBase:
+    """
+        Board state shared by every backend: move stack, cached winner,
+        Zobrist hash, window keys and the incremental evaluation.
+        Backends store the stones and implement place/remove, empty_sqr,
+        get_empty_sqrs and check_win.
+    """
+    def __init__(self, rows=ROWS, cols=COLS, win_length=WIN_LENGTH):
+        self.geometry = geometry(rows, cols, win_length)
+        self.rows = rows
+        self.cols = cols
+        self.size = rows * cols
+        # The geometry's tables used on every push/pop
+        self.cell_windows = self.geometry.cell_windows
+        self.neighbours = self.geometry.neighbours
+        self.zobrist_keys = self.geometry.zobrist_keys
+        self.symmetric_keys = self.geometry.symmetric_keys
+        self.key_base = self.geometry.key_base
+
+        self.marked_sqrs = 0
+        self.last_move = None  # (row, col) of the latest mark
+        self.winner = 0  # cached result of final_state
+        self.win_line = None  # ((row, col), (row, col)) ends of the winning run
+        self.move_stack = []  # [(row, col, player)] in the order they were played
+        self.win_ply = 0  # len(move_stack) when the winner was found
+        self.hash = 0  # Zobrist hash of the marked squares
+        # Zobrist hash of every rotation/reflection, symmetric_hashes[0] == hash
+        self.symmetric_hashes = [0] * len(self.geometry.symmetries)
+        # Player 1 count + key_base * player 2 count for every window of the geometry
+        self.window_keys = [0] * len(self.geometry.window_cells)
+        # Running evaluation, kept once an AI asks for it (see incremental_score)
+        self.eval_tables = None
+        self.eval_scores = [0, 0, 0]  # [unused, player 1's view, player 2's view]
+        # Empty squares next to a stone, with each square's number of neighbouring stones
+        self.candidates = set()
+        self.near = [0] * self.size
+
+    def final_state(self):
+        '''
+            @return 0 if there is no win yet
+            @return 1 if player 1 wins
+            @return 2 if player 2 wins
+        '''
+        # The winner is detected in mark_sqr, so this is only a lookup;
+        # win_line holds the ends of the winning run for the UI to draw
+        return self.winner
+
+    def mark_sqr(self, row, col, player):
+        self.push(row, col, player)
+
+    def push(self, row, col, player):
+        """Mark a square in place; undo it with pop()"""
+        self.place(row, col, player)
+        self.marked_sqrs += 1
+        self.last_move = (row, col)
+        self.move_stack.append((row, col, player))
+        self.hash ^= self.zobrist_keys[player][row][col]
+        cell = row * self.cols + col
+        self.symmetric_hashes = list(map(xor, self.symmetric_hashes, self.symmetric_keys[player][cell]))
+        self.update_windows(cell, player, 1)
+
+        # The square is taken and its empty neighbours become candidates
+        near = self.near
+        self.candidates.discard(cell)
+        for neighbour in self.neighbours[cell]:
+            near[neighbour] += 1
+            if near[neighbour] == 1 and self.empty_sqr(*divmod(neighbour, self.cols)):
+                self.candidates.add(neighbour)
+
+        if self.winner == 0:
+            win_line = self.check_win(row, col, player)
+            if win_line:
+                self.winner = player
+                self.win_line = win_line
+                self.win_ply = len(self.move_stack)
+
+    def pop(self):
+        """Undo the latest push and return its (row, col)"""
+        if self.winner != 0 and self.win_ply == len(self.move_stack):
+            self.winner = 0
+            self.win_line = None
+            self.win_ply = 0
+
+        row, col, player = self.move_stack.pop()
+        self.remove(row, col, player)
+        self.hash ^= self.zobrist_keys[player][row][col]
+        cell = row * self.cols + col
+        self.symmetric_hashes = list(map(xor, self.symmetric_hashes, self.symmetric_keys[player][cell]))
+        self.update_windows(cell, player, -1)
+
+        near = self.near
+        for neighbour in self.neighbours[cell]:
+            near[neighbour] -= 1
+            if near[neighbour] == 0:
+                self.candidates.discard(neighbour)
+        if near[cell] > 0:
+            self.candidates.add(cell)
+
+        self.marked_sqrs -= 1
+        self.last_move = self.move_stack[-1][:2] if self.move_stack else None
+        return row, col
+
+    def update_windows(self, cell, player, sign):
+        """Add (sign=1) or remove (sign=-1) a stone from the windows through cell"""
+        step = sign if player == 1 else self.key_base * sign
+        keys = self.window_keys
+
+        if self.eval_tables is None:
+            for window in self.cell_windows[cell]:
+                keys[window] += step
+            return
+
+        # Only the windows through the square change their score
+        table1, table2, cell_values = self.eval_tables
+        delta1 = delta2 = 0
+        for window in self.cell_windows[cell]:
+            old = keys[window]
+            new = old + step
+            keys[window] = new
+            delta1 += table1[new] - table1[old]
+            delta2 += table2[new] - table2[old]
+
+        value = sign * cell_values[cell]
+        if player == 1:
+            delta1 += value
+            delta2 -= value
+        else:
+            delta1 -= value
+            delta2 += value
+
+        self.eval_scores[1] += delta1
+        self.eval_scores[2] += delta2
+
+    def incremental_score(self, player, eval_tables):
+        """
+            Window and square score from player's view, kept up to date by push/pop
+            eval_tables = (window score for player 1, for player 2, value of each square)
+        """
+        if self.eval_tables is not eval_tables:
+            # Score the whole board once, push/pop keep it current after that
+            table1, table2, cell_values = eval_tables
+            scores = [0, sum(table1[key] for key in self.window_keys), sum(table2[key] for key in self.window_keys)]
+            for row, col, mark in self.move_stack:
+                value = cell_values[row * self.cols + col]
+                scores[mark] += value
+                scores[3 - mark] -= value
+            self.eval_tables = eval_tables
+            self.eval_scores = scores
+
+        return self.eval_scores[player]
+
+    def canonical_hash(self):
+        """
+            (smallest Zobrist hash over the board's symmetries, that symmetry)
+            Symmetric positions share it; symmetries[s] maps their squares to
+            the canonical orientation and inverse_symmetries[s] back.
+        """
+        hashes = self.symmetric_hashes
+        key = min(hashes)
+        return key, hashes.index(key)
+
+    def canonical_move(self, move, symmetry):
+        """move in the orientation of canonical_hash"""
+        if move is None or symmetry == 0:
+            return move
+        return divmod(self.geometry.symmetries[symmetry][move[0] * self.cols + move[1]], self.cols)
+
+    def actual_move(self, move, symmetry):
+        """A canonical_move turned back into this board's orientation"""
+        if move is None or symmetry == 0:
+            return move
+        return divmod(self.geometry.inverse_symmetries[symmetry][move[0] * self.cols + move[1]], self.cols)
+
+    def isfull(self):
+        return self.marked_sqrs == self.size
+
+    def isempty(self):
+        return self.marked_sqrs == 0
+
+    def copy(self):
+        """A board of the same backend with the same moves played, for searching off the UI's board"""
+        board = type(self)(self.rows, self.cols, self.geometry.win_length)
+        for row, col, player in self.move_stack:
+            board.push(row, col, player)
+        return board
+
+class Board(BoardBase):
+    """NumPy array backend, squares[row][col] is 0, 1 or 2"""
+    def __init__(self, rows=ROWS, cols=COLS, win_length=WIN_LENGTH):
+        super().__init__(rows, cols, win_length)
+        self.squares = np.zeros((rows, cols))
+        self.empty_sqrs = self.squares  # [squares]
+
+    def place(self, row, col, player):
+        self.squares[row, col] = player
+
+    def remove(self, row, col, player):
+        self.squares[row, col] = 0
+
+    def check_win(self, row, col, player):
+        """Return the ends of a winning run through (row, col), or None"""
+        win_length = self.geometry.win_length
+        rows, cols = self.rows, self.cols
+        squares = self.squares
+
+        # Only the four lines through the new mark can have changed
+        for dr, dc in ((1, 0), (0, 1), (1, 1), (-1, 1)):
+            # Walk backwards to the first stone of the run
+            r, c = row, col
+            while 0 <= r - dr < rows and 0 <= c - dc < cols and squares[r - dr, c - dc] == player:
+                r, c = r - dr, c - dc
+            start = (r, c)
+
+            # Walk forwards to the last stone of the run
+            r, c = row, col
+            while 0 <= r + dr < rows and 0 <= c + dc < cols and squares[r + dr, c + dc] == player:
+                r, c = r + dr, c + dc
+
+            if max(abs(r - start[0]), abs(c - start[1])) + 1 >= win_length:
+                return start, (r, c)
+
+        return None
+
+    def empty_sqr(self, row, col):
+        return self.squares[row][col] == 0
+
+    def get_empty_sqrs(self):
+        empty_sqrs = []
+        for row in range(self.rows):
+            for col in range(self.cols):
+                if self.empty_sqr(row, col):
+                    empty_sqrs.append((row, col))
+        
+        return empty_sqrs
+
+class BitBoard(BoardBase):
+    """Bitboard backend, each player's stones are the bits (row * cols + col) of an int"""
+    def __init__(self, rows=ROWS, cols=COLS, win_length=WIN_LENGTH):
+        super().__init__(rows, cols, win_length)
+        self.stones = [0, 0, 0]  # [all stones, player 1, player 2]
+
+    @property
+    def squares(self):
+        """The board as a new array, like Board.squares (writes don't reach the board)"""
+        n_bytes = (self.size + 7) // 8
+        player1 = np.frombuffer(self.stones[1].to_bytes(n_bytes, 'little'), dtype=np.uint8)
+        player2 = np.frombuffer(self.stones[2].to_bytes(n_bytes, 'little'), dtype=np.uint8)
+        player1 = np.unpackbits(player1, bitorder='little')[:self.size]
+        player2 = np.unpackbits(player2, bitorder='little')[:self.size]
+        return (player1 + 2.0 * player2).reshape(self.rows, self.cols)
+
+    def place(self, row, col, player):
+        bit = 1 << (row * self.cols + col)
+        self.stones[0] |= bit
+        self.stones[player] |= bit
+
+    def remove(self, row, col, player):
+        bit = ~(1 << (row * self.cols + col))
+        self.stones[0] &= bit
+        self.stones[player] &= bit
+
+    def check_win(self, row, col, player):
+        """Return the ends of a winning run through (row, col), or None"""
+        stones = self.stones[player]
+        geometry = self.geometry
+        run = None
+
+        # Windows through a square are grouped by direction and sorted along it,
+        # so full windows of one direction chain into a single run
+        for window in self.cell_windows[row * self.cols + col]:
+            mask = geometry.window_masks[window]
+            if stones & mask == mask:
+                first, last = geometry.window_ends[window]
+                if run is None:
+                    run = (first, last, geometry.window_directions[window])
+                elif run[2] == geometry.window_directions[window]:
+                    run = (run[0], last, run[2])
+                else:
+                    break
+
+        return run[:2] if run else None
+
+    def empty_sqr(self, row, col):
+        return not self.stones[0] >> (row * self.cols + col) & 1
+
+    def get_empty_sqrs(self):
+        occupied = self.stones[0]
+        cols = self.cols
+        return [divmod(cell, cols) for cell in range(self.size) if not occupied >> cell & 1]
+
+# Boards the AI can play on, selected with BOARD_BACKEND in constants.py
+BOARD_BACKENDS = {'array': Board, 'bitboard': BitBoard}
+
+def new_board(backend=BOARD_BACKEND, rows=ROWS, cols=COLS, win_length=WIN_LENGTH):
+    return BOARD_BACKENDS[backend](rows, cols, win_length)
+
+class AI:
+    def __init__(self, level=1, player=2, tt_size_mb=16, time_budget_ms=None, evaluator='incremental',
+                 check_eval=False, max_candidates=10, workers=1, rows=ROWS, cols=COLS, win_length=WIN_LENGTH,
+                 book=None, symmetric_tt=True, threat_nodes=3000, threat_cache_size=1_000_000, weights=None,
+                 quiescence_nodes=QUIESCENCE_NODES,
+                 search='minimax', lmr_moves=LMR_MOVES):
+        self.level = level
+        self.geometry = geometry(rows, cols, win_length)  # boards passed to eval must have the same
+        self.player = player
+        self.opponent = 1 if player == 2 else 2
+        self.evaluator = evaluator  # 'incremental', 'numpy' or 'python' (the original loops)
+        self.check_eval = check_eval  # compare the incremental score with a full evaluation
+        self.weights = weights or DEFAULT_WEIGHTS  # see load_weights
+        self.window_table = self.build_window_table()
+        self.eval_tables = self.build_eval_tables()
+        # Kept for the whole game so later moves reuse earlier searches
+        self.tt = TranspositionTable(tt_size_mb, cols)
+        # Key the table by the canonical hash so rotated and mirrored positions share entries
+        self.symmetric_tt = symmetric_tt
+        self.time_budget_ms = time_budget_ms  # None = always search to max_depth
+        self.deadline = None  # perf_counter() time the running search must stop at
+        # Set by stop() from another thread; the caller clears it before the next search
+        self.stop_event = threading.Event()
+        self.nodes = 0  # nodes visited by the current search
+        self.leaves = 0  # nodes scored by evaluate_board at max_depth
+        self.cutoffs = 0  # nodes that stopped early on an alpha-beta cutoff
+        self.iterations = []  # (depth, seconds, nodes) per completed iteration
+        self.pv = []  # principal variation of the last completed iteration
+        self.root_ply = 0  # len(board.move_stack) at the search root
+        self.depth_reached = 0
+        self.max_candidates = max_candidates  # moves searched per node
+        self.killers = [[None, None] for _ in range(self.geometry.size)]  # per depth, moves that caused cutoffs
+        self.history = [None, [0] * self.geometry.size, [0] * self.geometry.size]  # per player and square, cutoff credit
+        self.workers = workers  # > 1 splits the root moves across processes (parallel.py)
+        self.parallel = None
+        self.book = book  # OpeningBook (book.py) answering the first plies without a search
+        self.pondered = {}  # position hash -> (move, depth, pv) searched by ponder() on the opponent's time
+        self.ponder_depth = 0  # depth a pondered move needs to be played without a search
+        # VCF/VCT search run before minimax, threat_nodes=0 turns it off
+        self.threats = ThreatSolver(threat_nodes, cache_size=threat_cache_size,
+                                    stop_event=self.stop_event) if threat_nodes else None
+        # Leaves search fours and blocks past max_depth, quiescence_nodes=0 scores them as they stand
+        self.quiescence_nodes = quiescence_nodes
+        self.quiescence_left = 0  # nodes the current leaf's quiescence may still visit
+        self.quiescence_root = 0  # depth of the leaf it started at
+        if search not in SEARCHES:
+            raise ValueError(f"unknown search {search!r}, expected one of {SEARCHES}")
+        self.search = search
+        self.lmr_moves = lmr_moves  # pvs only, 0 = no late move reductions
+        self.researches = 0  # pvs searches repeated after a null or aspiration window failed
+
+    # --- RANDOM ---
+    def rnd(self, board):
+        empty_sqrs = board.get_empty_sqrs()
+        if empty_sqrs:  # Make sure there are empty squares
+            idx = random.randrange(0, len(empty_sqrs))
+            return empty_sqrs[idx]  # (row, col)
+        return None  # Return None if no empty squares (shouldn't happen)
+
+    # --- EVALUATION FUNCTION ---
+    def evaluate_board(self, board):
+        if self.evaluator == 'python':
+            return self.evaluate_board_python(board)
+
+        # Terminal states
+        final_state = board.final_state()
+        if final_state == self.player:  # AI wins
+            return 10000
+        elif final_state == self.opponent:  # Human wins
+            return -10000
+        elif board.isfull():  # Draw
+            return 0
+
+        if self.evaluator == 'incremental':
+            score = board.incremental_score(self.player, self.eval_tables)
+            if self.check_eval:
+                expected = self.evaluate_windows(board)
+                if score != expected:
+                    raise AssertionError(f"incremental evaluation {score} != full evaluation {expected}")
+            return score
+
+        return self.evaluate_windows(board)
+
+    def evaluate_windows(self, board):
+        """Score all windows and the center of a non-terminal board at once"""
+        # An AI stone counts 1 and a human stone key_base, so the sum over a
+        # window is ai_count + key_base * human_count, the index into window_table
+        geometry = self.geometry
+        squares = board.squares.ravel()
+        cells = (squares == self.player) + geometry.key_base * (squares == self.opponent)
+        score = self.window_table[cells[geometry.window_cells].sum(1)].sum()
+
+        # Center positions are more valuable
+        center = cells[geometry.center_cells]
+        score += self.weights['center'] * (np.count_nonzero(center == 1) - np.count_nonzero(center == geometry.key_base))
+
+        return int(score)
+
+    def evaluate_board_python(self, board):
+        """Reference evaluation, scores every window one by one"""
+        win_length = self.geometry.win_length
+        rows, cols = self.geometry.rows, self.geometry.cols
+        
+        # Terminal states
+        final_state = board.final_state()
+        if final_state == self.player:  # AI wins
+            return 10000
+        elif final_state == self.opponent:  # Human wins
+            return -10000
+        elif board.isfull():  # Draw
+            return 0
+        
+        # Non-terminal evaluation
+        squares = board.squares
+        score = 0
+        
+        # Evaluate rows
+        for row in range(rows):
+            for col in range(cols - win_length + 1):
+                window = [squares[row][col + i] for i in range(win_length)]
+                score += self.evaluate_window(window)
+        
+        # Evaluate columns
+        for col in range(cols):
+            for row in range(rows - win_length + 1):
+                window = [squares[row + i][col] for i in range(win_length)]
+                score += self.evaluate_window(window)
+        
+        # Evaluate diagonals (descending)
+        for row in range(rows - win_length + 1):
+            for col in range(cols - win_length + 1):
+                window = [squares[row + i][col + i] for i in range(win_length)]
+                score += self.evaluate_window(window)
+        
+        # Evaluate diagonals (ascending)
+        for row in range(win_length - 1, rows):
+            for col in range(cols - win_length + 1):
+                window = [squares[row - i][col + i] for i in range(win_length)]
+                score += self.evaluate_window(window)
+        
+        # Evaluate strategic positions
+        # Center positions are more valuable
+        center_value = self.weights['center']
+        for row, col in self.geometry.center_moves:
+            if squares[row][col] == self.player:  # AI
+                score += center_value
+            elif squares[row][col] == self.opponent:  # Human
+                score -= center_value
+        
+        return score
+    
+    def build_window_table(self):
+        """evaluate_window for every (ai_count, human_count), indexed by ai_count + key_base * human_count"""
+        win_length = self.geometry.win_length
+        base = self.geometry.key_base
+        table = np.zeros(base * base, dtype=np.int64)
+        for ai_count in range(win_length + 1):
+            for human_count in range(win_length + 1 - ai_count):
+                empty_count = win_length - ai_count - human_count
+                window = [self.player] * ai_count + [self.opponent] * human_count + [0] * empty_count
+                table[ai_count + base * human_count] = self.evaluate_window(window)
+        return table
+
+    def build_eval_tables(self):
+        """Tables for Board.incremental_score, indexed by player 1 count + key_base * player 2 count"""
+        base = self.geometry.key_base
+        table = self.window_table.tolist()
+        # window_table is indexed from the scorer's side, so player 2 swaps the counts
+        table1 = table
+        table2 = [table[key // base + base * (key % base)] for key in range(len(table))]
+
+        cell_values = [0] * self.geometry.size
+        for cell in self.geometry.center_cells.tolist():
+            cell_values[cell] = self.weights['center']
+        return table1, table2, cell_values
+
+    def evaluate_window(self, window):
+        win_length = self.geometry.win_length
+        developing, three, four, five = self.weights['window']
+        score = 0
+        
+        # Count pieces in the window
+        ai_count = window.count(self.player)
+        human_count = window.count(self.opponent)
+        empty_count = window.count(0)
+        
+        # Ensure no mixed pieces (both AI and human in the same window)
+        if ai_count > 0 and human_count > 0:
+            return 0  # Window is blocked
+        
+        # Calculate score based on piece configuration
+        if ai_count == win_length:
+            return five  # Immediate win
+        
+        # Threat levels for AI
+        if ai_count == win_length - 1 and empty_count == 1:
+            score += four  # One move away from winning
+        elif ai_count == win_length - 2 and empty_count == 2:
+            score += three  # Two moves away from winning
+        elif ai_count == win_length - 3 and empty_count == 3:
+            score += developing  # Developing position
+        
+        # Threat levels for human
+        if human_count == win_length:
+            return -five  # Immediate loss
+        
+        if human_count == win_length - 1 and empty_count == 1:
+            score -= four  # Block immediate threat
+        elif human_count == win_length - 2 and empty_count == 2:
+            score -= three  # Block developing threat
+        elif human_count == win_length - 3 and empty_count == 3:
+            score -= developing  # Block early development
+        
+        return score
+    
+    # --- MINIMAX WITH ALPHA-BETA PRUNING ---
+    def minimax(self, board, maximizing, depth, max_depth, alpha=-float('inf'), beta=float('inf')):
+        # Check the clock and stop() every 16 nodes
+        self.nodes += 1
+        if self.nodes & 15 == 0 and (self.stop_event.is_set() or
+                                     self.deadline is not None and time.perf_counter() > self.deadline):
+            raise SearchTimeout
+
+        # Terminal case or max depth reached
+        if depth >= max_depth:
+            if self.quiescence_nodes:
+                self.quiescence_left = self.quiescence_nodes
+                self.quiescence_root = depth
+                return self.quiesce(board, maximizing, depth, alpha, beta), None
+            self.leaves += 1
+            return self.evaluate_board(board), None
+        
+        case = board.final_state()
+        if case == self.player:  # AI wins
+            return 10000 - depth, None  # Prefer quicker wins
+        if case == self.opponent:  # Human wins
+            return -10000 + depth, None  # Delay losses
+        if board.isfull():  # Draw
+            return 0, None
+        
+        # On a 10x10 or larger board, we need to be more selective about moves to consider
+        mover = self.player if maximizing else self.opponent
+        empty_sqrs = self.get_strategic_moves(board, mover, depth)
+        
+        if not empty_sqrs:  # Safety check
+            return 0, None
+
+        # Look the position up in the transposition table
+        key, symmetry = self.position_key(board, maximizing)
+        entry = self.tt.probe(key, depth)
+        if entry is not None:
+            tt_depth, flag, score, tt_move = entry
+            tt_move = board.actual_move(tt_move, symmetry)
+            # The root always searches so it can return a move
+            if depth > 0 and tt_depth >= max_depth - depth:
+                if flag == EXACT:
+                    return score, tt_move
+                if flag == LOWER and score >= beta:
+                    return score, tt_move
+                if flag == UPPER and score <= alpha:
+                    return score, tt_move
+
+            # Try the stored best move first
+            self.move_first(board, empty_sqrs, tt_move)
+
+        # Follow the previous iteration's principal variation first
+        if depth < len(self.pv):
+            path = [move[:2] for move in board.move_stack[self.root_ply:]]
+            if path == self.pv[:depth]:
+                self.move_first(board, empty_sqrs, self.pv[depth])
+
+        alpha_orig, beta_orig = alpha, beta
+
+        if maximizing:
+            max_eval = -float('inf')
+            best_move = empty_sqrs[0]  # Default to first move
+            
+            for (row, col) in empty_sqrs:
+                board.push(row, col, self.player)  # AI move
+                eval, _ = self.minimax(board, False, depth + 1, max_depth, alpha, beta)
+                board.pop()
+                
+                if eval > max_eval:
+                    max_eval = eval
+                    best_move = (row, col)
+                
+                alpha = max(alpha, max_eval)
+                if beta <= alpha:
+                    self.record_cutoff(mover, (row, col), depth, max_depth)
+                    break  # Prune branch
+
+            self.store(key, depth, max_depth, alpha_orig, beta_orig, max_eval, board.canonical_move(best_move, symmetry))
+            return max_eval, best_move
+        
+        else:
+            min_eval = float('inf')
+            best_move = empty_sqrs[0]  # Default to first move
+            
+            for (row, col) in empty_sqrs:
+                board.push(row, col, self.opponent)  # Human move
+                eval, _ = self.minimax(board, True, depth + 1, max_depth, alpha, beta)
+                board.pop()
+                
+                if eval < min_eval:
+                    min_eval = eval
+                    best_move = (row, col)
+                
+                beta = min(beta, min_eval)
+                if beta <= alpha:
+                    self.record_cutoff(mover, (row, col), depth, max_depth)
+                    break  # Prune branch
+
+            self.store(key, depth, max_depth, alpha_orig, beta_orig, min_eval, board.canonical_move(best_move, symmetry))
+            return min_eval, best_move
+
+    # --- PRINCIPAL VARIATION SEARCH ---
+    def pvs(self, board, depth, max_depth, alpha=-float('inf'), beta=float('inf')):
+        """
+            Negamax alpha-beta that searches the first move with the full
+            window and the others with a null window, again in full only if
+            they beat it. Late moves are first searched a ply shallower.
+            Scores are from the view of the side to move, the AI at even depths
+        """
+        self.nodes += 1
+        if self.nodes & 15 == 0 and (self.stop_event.is_set() or
+                                     self.deadline is not None and time.perf_counter() > self.deadline):
+            raise SearchTimeout
+
+        maximizing = depth % 2 == 0
+        sign = 1 if maximizing else -1
+        if depth >= max_depth:
+            if self.quiescence_nodes:
+                self.quiescence_left = self.quiescence_nodes
+                self.quiescence_root = depth
+                if maximizing:
+                    return self.quiesce(board, True, depth, alpha, beta), None
+                return -self.quiesce(board, False, depth, -beta, -alpha), None
+            self.leaves += 1
+            return sign * self.evaluate_board(board), None
+
+        case = board.final_state()
+        if case == self.player:
+            return sign * (10000 - depth), None
+        if case == self.opponent:
+            return -sign * (10000 - depth), None
+        if board.isfull():
+            return 0, None
+
+        mover = self.player if maximizing else self.opponent
+        moves = self.get_strategic_moves(board, mover, depth)
+        if not moves:
+            return 0, None
+
+        # The table holds scores from the AI's view, shared with minimax
+        key, symmetry = self.position_key(board, maximizing)
+        entry = self.tt.probe(key, depth)
+        if entry is not None:
+            tt_depth, flag, score, tt_move = entry
+            tt_move = board.actual_move(tt_move, symmetry)
+            if depth > 0 and tt_depth >= max_depth - depth:
+                score *= sign
+                if not maximizing and flag != EXACT:
+                    flag = UPPER if flag == LOWER else LOWER
+                if flag == EXACT or flag == LOWER and score >= beta or flag == UPPER and score <= alpha:
+                    return score, tt_move
+            self.move_first(board, moves, tt_move)
+
+        if depth < len(self.pv):
+            path = [move[:2] for move in board.move_stack[self.root_ply:]]
+            if path == self.pv[:depth]:
+                self.move_first(board, moves, self.pv[depth])
+
+        alpha_orig = alpha
+        best = -float('inf')
+        best_move = moves[0]
+        reduce = self.lmr_moves and max_depth - depth >= LMR_MIN_DEPTH
+        for i, (row, col) in enumerate(moves):
+            board.push(row, col, mover)
+            if i == 0:
+                score = -self.pvs(board, depth + 1, max_depth, -beta, -alpha)[0]
+            else:
+                reduction = 1 if reduce and i >= self.lmr_moves else 0
+                score = -self.pvs(board, depth + 1, max_depth - reduction, -alpha - 1, -alpha)[0]
+                if score > alpha and reduction:
+                    score = -self.pvs(board, depth + 1, max_depth, -alpha - 1, -alpha)[0]
+                if alpha < score < beta:
+                    self.researches += 1
+                    score = -self.pvs(board, depth + 1, max_depth, -beta, -alpha)[0]
+            board.pop()
+
+            if score > best:
+                best = score
+                best_move = (row, col)
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                self.record_cutoff(mover, (row, col), depth, max_depth)
+                break
+
+        # Stored from the AI's view: a min node's window flips
+        if maximizing:
+            self.store(key, depth, max_depth, alpha_orig, beta, best, board.canonical_move(best_move, symmetry))
+        else:
+            self.store(key, depth, max_depth, -beta, -alpha_orig, -best, board.canonical_move(best_move, symmetry))
+        return best, best_move
+
+    def aspiration(self, board, max_depth, guess=None):
+        """pvs at the root in a window around guess, widened to the side it fails on"""
+        if guess is None or abs(guess) > WIN_SCORE:
+            return self.pvs(board, 0, max_depth)
+        alpha, beta = guess - ASPIRATION_WINDOW, guess + ASPIRATION_WINDOW
+        while True:
+            score, move = self.pvs(board, 0, max_depth, alpha, beta)
+            if score <= alpha:
+                alpha = -float('inf')
+            elif score >= beta:
+                beta = float('inf')
+            else:
+                return score, move
+            self.researches += 1
+
+    # --- QUIESCENCE ---
+    def quiesce(self, board, maximizing, depth, alpha, beta):
+        """
+            Score a leaf, playing on while the side to move is forced: it
+            blocks a four or an open three, and wins with one of its own.
+            A quiet position is scored by evaluate_board
+        """
+        self.nodes += 1
+        if self.nodes & 15 == 0 and (self.stop_event.is_set() or
+                                     self.deadline is not None and time.perf_counter() > self.deadline):
+            raise SearchTimeout
+
+        case = board.final_state()
+        if case == self.player:
+            return 10000 - depth
+        if case == self.opponent:
+            return -10000 + depth
+        if board.isfull():
+            return 0
+
+        mover, other = (self.player, self.opponent) if maximizing else (self.opponent, self.player)
+        sign = 1 if maximizing else -1
+        # A line to complete wins next move; two of the opponent's can't both be blocked
+        if wins(board, mover):
+            return sign * (10000 - depth - 1)
+        blocks = wins(board, other)
+        if len(blocks) > 1:
+            return -sign * (10000 - depth - 2)
+        # An open three of the mover's becomes an open four the opponent can't stop
+        if not blocks and open_fours(board, mover):
+            return sign * (10000 - depth - 3)
+
+        self.quiescence_left -= 1
+        if self.quiescence_left <= 0:
+            self.leaves += 1
+            return self.evaluate_board(board)
+        moves = blocks or open_fours(board, other)
+        if moves:
+            # Forced: no standing pat on the evaluation
+            best = -sign * float('inf')
+        else:
+            best = self.evaluate_board(board)
+            moves = fours(board, mover) if depth - self.quiescence_root < QUIESCENCE_FOUR_PLIES else []
+            if maximizing:
+                alpha = max(alpha, best)
+            else:
+                beta = min(beta, best)
+            if not moves or beta <= alpha:
+                self.leaves += 1
+                return best
+
+        for move in moves:
+            board.push(*move, mover)
+            value = self.quiesce(board, not maximizing, depth + 1, alpha, beta)
+            board.pop()
+            if maximizing:
+                best = max(best, value)
+                alpha = max(alpha, best)
+            else:
+                best = min(best, value)
+                beta = min(beta, best)
+            if beta <= alpha:
+                break
+        return best
+
+    def move_first(self, board, moves, move):
+        """Put move at the front of the list if it can be played"""
+        if move is not None and board.empty_sqr(*move):
+            if move in moves:
+                moves.remove(move)
+            moves.insert(0, move)
+
+    def position_key(self, board, maximizing):
+        """Transposition table key of the position and the symmetry its moves are stored in"""
+        if self.symmetric_tt:
+            key, symmetry = board.canonical_hash()
+        else:
+            key, symmetry = board.hash, 0
+        return key ^ SIDE_KEYS[self.player][maximizing], symmetry
+
+    def store(self, key, depth, max_depth, alpha, beta, score, move):
+        """Save a search result with the bound it proves for the (alpha, beta) window"""
+        if score <= alpha:
+            flag = UPPER
+        elif score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.tt.store(key, depth, max_depth - depth, flag, score, move)
+    
+    def get_strategic_moves(self, board, player=None, depth=0):
+        """Get the most promising moves for player, best first, instead of all empty squares"""
+        if player is None:
+            player = self.player
+
+        # If the board is empty or nearly empty, just play near the center
+        if board.isempty() or board.marked_sqrs < 3:
+            return [(r, c) for r, c in self.geometry.center_moves
+                    if board.empty_sqr(r, c)][:5]
+
+        # We can't consider all empty squares in minimax
+        # We'll focus on squares that are adjacent to already occupied squares,
+        # ranked by the threats they make or stop
+        geometry = self.geometry
+        threats = geometry.threat_tables[player]
+        cell_window_keys = geometry.cell_window_keys
+        history = self.history[player]
+        keys = board.window_keys
+        scored = [(sum(map(threats.__getitem__, cell_window_keys[cell](keys))) + min(history[cell], HISTORY_LIMIT), cell)
+                  for cell in board.candidates]
+
+        # Moves that cut off a sibling search are likely good here too
+        for killer in self.killers[depth]:
+            if killer is not None and killer in board.candidates:
+                scored.append((KILLER_BONUS, killer))
+
+        scored.sort(reverse=True)
+        strategic_moves = []
+        seen = set()
+        for _, cell in scored:
+            if cell not in seen:
+                seen.add(cell)
+                strategic_moves.append(divmod(cell, geometry.cols))
+
+        # If no strategic moves found or if we have too few options, add some default moves
+        if len(strategic_moves) < 5:
+            # Add center positions
+            center_moves = [(r, c) for r, c in geometry.center_moves
+                            if board.empty_sqr(r, c) and (r, c) not in strategic_moves]
+            strategic_moves.extend(center_moves[:5])
+
+            # If still not enough, add some random moves
+            if len(strategic_moves) < 5:
+                remaining = [move for move in board.get_empty_sqrs() if move not in strategic_moves]
+                strategic_moves.extend(remaining[:5])
+
+        # Limit the number of moves to keep calculation time reasonable
+        return strategic_moves[:self.max_candidates]
+
+    def record_cutoff(self, player, move, depth, max_depth):
+        """Remember a move that pruned its siblings for ordering later searches"""
+        self.cutoffs += 1
+        cell = move[0] * self.geometry.cols + move[1]
+        killers = self.killers[depth]
+        if killers[0] != cell:
+            killers[1] = killers[0]
+            killers[0] = cell
+        self.history[player][cell] += (max_depth - depth) ** 2
+
+    def principal_variation(self, board, max_depth):
+        """Follow the best moves stored in the transposition table"""
+        pv = []
+        maximizing = True
+        while len(pv) < max_depth and board.final_state() == 0:
+            key, symmetry = self.position_key(board, maximizing)
+            entry = self.tt.probe(key, len(pv))
+            move = board.actual_move(entry[3], symmetry) if entry is not None else None
+            if move is None or not board.empty_sqr(*move):
+                break
+            board.push(*move, self.player if maximizing else self.opponent)
+            pv.append(move)
+            maximizing = not maximizing
+
+        for _ in pv:
+            board.pop()
+        return pv
+
+    # --- ITERATIVE DEEPENING ---
+    def iterative_deepening(self, board, max_depth, time_budget_ms=None):
+        """Search depth 1, 2, 3, ... and return the best move of the last completed depth"""
+        start = time.perf_counter()
+        self.nodes = self.leaves = self.cutoffs = self.researches = 0
+        self.iterations = []
+        self.pv = []
+        self.root_ply = len(board.move_stack)
+        self.depth_reached = 0
+        max_depth = min(max_depth, board.size - board.marked_sqrs)
+        best_move = None
+
+        # Killers belong to this position, history fades from earlier moves
+        self.killers = [[None, None] for _ in range(max_depth + 1)]
+        for player in (1, 2):
+            self.history[player] = [credit // 2 for credit in self.history[player]]
+
+        try:
+            for depth in range(1, max_depth + 1):
+                # Depth 1 always finishes so there is a move to return
+                if time_budget_ms is not None and depth > 1:
+                    self.deadline = start + time_budget_ms / 1000
+
+                if self.search == 'pvs':
+                    score, move = self.aspiration(board, depth, score if depth > 1 else None)
+                else:
+                    score, move = self.minimax(board, True, 0, depth)
+                best_move = move
+                self.depth_reached = depth
+                self.iterations.append((depth, time.perf_counter() - start, self.nodes))
+                self.pv = self.principal_variation(board, depth)
+
+                # Stop on a proven result
+                if abs(score) > WIN_SCORE:
+                    break
+                # The next depth costs several times this one, don't start what can't finish
+                if time_budget_ms is not None and time.perf_counter() - start > time_budget_ms / 2000:
+                    break
+        except SearchTimeout:
+            # Undo the marks of the interrupted search
+            while len(board.move_stack) > self.root_ply:
+                board.pop()
+        finally:
+            self.deadline = None
+
+        return best_move
+
+    def parallel_search(self, board, max_depth, time_budget_ms=None):
+        """iterative_deepening with the root moves spread over a process pool"""
+        if self.parallel is None:
+            from parallel import ParallelSearch
+            self.parallel = ParallelSearch(self.workers)
+
+        move = self.parallel.search(board, self, max_depth, time_budget_ms)
+        self.nodes = self.parallel.nodes
+        self.depth_reached = self.parallel.depth_reached
+        return move
+
+    def find_winning_move(self, board, player):
+        """Find a move that would immediately win the game"""
+        # Only a window holding win_length - 1 of player's stones and none of
+        # the opponent's can be completed, and its empty square is a candidate
+        geometry = self.geometry
+        full = (geometry.win_length - 1) * (1 if player == 1 else geometry.key_base)
+        keys = board.window_keys
+        for cell in sorted(board.candidates):
+            if full in geometry.cell_window_keys[cell](keys):
+                return divmod(cell, geometry.cols)
+        return None
+    
+    def stop_threats(self, board, move, reason='search'):
+        """
+            @return (move, reason) if the opponent has no VCF after move
+            @return (a move that stops the VCF, 'defence') otherwise, if there is one
+        """
+        board.push(*move, self.player)
+        result, _ = self.threats.solve(board, self.opponent, vct=False)
+        board.pop()
+        if result == WIN:
+            defence = self.threats.defence(board, self.player, self.get_strategic_moves(board, self.player, 0))
+            if defence:
+                return defence, 'defence'
+        return move, reason
+
+    def stop(self):
+        """
+            End the running eval from another thread. It returns its best move
+            so far, or None with reason 'stopped' if it had none
+        """
+        self.stop_event.set()
+
+    # --- PONDERING ---
+    def ponder(self, board, max_depth, replies=3):
+        """
+            Search the likeliest opponent replies on board, opponent to move,
+            one depth at a time for all of them until stop(). eval answers a
+            reply searched as deep as the last move's search without searching
+            again, other replies start from the table this filled
+        """
+        self.pondered = {}
+        # As deep as the last search got; before any search, pondering only warms the table
+        self.ponder_depth = self.depth_reached or max_depth
+        moves = self.get_strategic_moves(board, self.opponent, 0)[:replies]
+        # The reply the last search expected comes first
+        if len(self.pv) > 1 and self.pv[0] == board.last_move and self.pv[1] in board.get_empty_sqrs():
+            moves = [self.pv[1]] + [move for move in moves if move != self.pv[1]][:replies - 1]
+
+        max_depth = min(max_depth, board.size - board.marked_sqrs - 1)
+        for depth in range(1, max_depth + 1):
+            for reply in moves:
+                board.push(*reply, self.opponent)
+                try:
+                    if board.final_state() == 0 and not board.isfull():
+                        move = self.iterative_deepening(board, depth)
+                        if self.stop_event.is_set():
+                            return
+                        self.pondered[board.hash] = (move, depth, self.pv)
+                finally:
+                    board.pop()
+
+    # --- MAIN EVAL ---
+    def eval(self, main_board, max_depth=2, time_budget_ms=None, stats=False, trace=False):
+        """
+            @return (row, col) of the AI's move
+            @return ((row, col), SearchStats) if stats or trace is set
+        """
+        if main_board.geometry is not self.geometry:
+            ai, board = self.geometry, main_board.geometry
+            raise ValueError(f"the AI plays {ai.win_length} in a row on {ai.rows}x{ai.cols}, "
+                             f"the board is {board.win_length} in a row on {board.rows}x{board.cols}")
+        if not (stats or trace):
+            return self.choose_move(main_board, max_depth, time_budget_ms)[0]
+
+        search_stats = SearchStats(trace)
+        search_stats.attach(self)
+        try:
+            move, search_stats.reason = self.choose_move(main_board, max_depth, time_budget_ms)
+        finally:
+            search_stats.detach(self)
+        search_stats.move = move
+        return move, search_stats
+
+    def choose_move(self, main_board, max_depth, time_budget_ms):
+        """@return (move, reason), reason says which rule picked the move"""
+        if main_board.isempty():
+            # If board is empty, choose a position in the center area
+            return random.choice(self.geometry.center_moves), 'opening'
+            
+        if self.level == 0:
+            # Random choice
+            move = self.rnd(main_board)
+            if move is None:  # Safety check
+                # If no empty squares, just return something (shouldn't happen)
+                print("Warning: No empty squares found for random move")
+                return (0, 0), 'random'
+            return move, 'random'
+        else:
+            # The search marks and unmarks main_board in place
+            stack_size = len(main_board.move_stack)
+            try:
+                # Known opening positions were searched deeper offline
+                if self.book is not None:
+                    book_move = self.book.lookup(main_board)
+                    if book_move:
+                        return book_move, 'book'
+
+                # Check for immediate win
+                win_move = self.find_winning_move(main_board, self.player)
+                if win_move:
+                    return win_move, 'win'
+                    
+                # Check for immediate block
+                block_move = self.find_winning_move(main_board, self.opponent)
+                if block_move:
+                    return block_move, 'block'
+
+                if time_budget_ms is None:
+                    time_budget_ms = self.time_budget_ms
+
+                # Forced wins by threats are often deeper than minimax can see
+                if self.threats is not None:
+                    start = time.perf_counter()
+                    deadline = None if time_budget_ms is None else start + time_budget_ms * THREAT_TIME_SHARE / 1000
+                    result, line = self.threats.solve(main_board, self.player, deadline=deadline)
+                    if result == WIN:
+                        return line[0], 'threat'
+                    # The threat search spent part of the move's time
+                    if time_budget_ms is not None:
+                        time_budget_ms = max(time_budget_ms - (time.perf_counter() - start) * 1000, 1)
+
+                # A reply searched deep enough while the opponent was thinking is played
+                # at once; otherwise the search starts from the table ponder() filled
+                pondered = self.pondered.get(main_board.hash)
+                needed = max_depth if time_budget_ms is None else min(max_depth, self.ponder_depth)
+                reason = 'search'
+                if pondered is not None and pondered[1] >= needed:
+                    move, self.depth_reached, self.pv = pondered
+                    reason = 'ponder'
+                # Use minimax for strategic play, as deep as the time budget allows
+                elif self.workers > 1:
+                    move = self.parallel_search(main_board, max_depth, time_budget_ms)
+                else:
+                    move = self.iterative_deepening(main_board, max_depth, time_budget_ms)
+                
+                # Safety check in case minimax returns None
+                if move is None:
+                    if self.stop_event.is_set():
+                        return None, 'stopped'
+                    print("Warning: Minimax returned None")
+                    return self.rnd(main_board), 'fallback'
+
+                if self.threats is not None:
+                    return self.stop_threats(main_board, move, reason)
+                return move, reason  # row, col
+            
+            except Exception as e:
+                print(f"Error in AI eval: {e}")
+                # Undo whatever the failed search left on the board
+                while len(main_board.move_stack) > stack_size:
+                    main_board.pop()
+                # Fall back to random move if minimax fails
+                return self.rnd(main_board), 'fallback'
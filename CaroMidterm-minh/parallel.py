@@ -0,0 +1,187 @@
+"""Root-parallel search: the root moves are searched by a pool of processes
+
+    python parallel.py --workers 1 2 4 --depth 4 --positions 5
+"""
+import argparse
+import math
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from engine import AI, SearchTimeout
+from transposition import TranspositionTable, WIN_SCORE
+
+# --- WORKER PROCESS ---
+
+_shared_alpha = None  # best root score found so far, shared by all workers
+_worker_ai = None  # kept between tasks so the worker's transposition table stays warm
+_worker_options = None
+
+
+def _init_worker(shared_alpha):
+    global _shared_alpha
+    _shared_alpha = shared_alpha
+
+
+def _search_root_move(board_class, moves, ai_options, move, max_depth, deadline):
+    """
+        Search one root move in a worker
+        @return (move, score, alpha, nodes), score is None if the deadline passed
+    """
+    global _worker_ai, _worker_options
+    if _worker_ai is None or _worker_options != ai_options:
+        _worker_ai = AI(**ai_options)
+        _worker_options = ai_options
+    ai = _worker_ai
+
+    board = board_class(ai_options['rows'], ai_options['cols'], ai_options['win_length'])
+    for row, col, player in moves:
+        board.push(row, col, player)
+
+    ai.nodes = 0
+    ai.pv = []
+    ai.deadline = deadline
+    # Moves scoring at or below the best root score so far can't be the best,
+    # so the search only has to prove that (fail low) for them
+    alpha = _shared_alpha.value
+    board.push(*move, ai.player)
+    try:
+        if ai.search == 'pvs':
+            score = -ai.pvs(board, 1, max_depth, -math.inf, -alpha)[0]
+        else:
+            score, _ = ai.minimax(board, False, 1, max_depth, alpha, math.inf)
+    except SearchTimeout:
+        return move, None, alpha, ai.nodes
+    finally:
+        ai.deadline = None
+
+    with _shared_alpha.get_lock():
+        if score > _shared_alpha.value:
+            _shared_alpha.value = score
+    return move, score, alpha, ai.nodes
+
+
+def _warm_up():
+    return None
+
+# --- POOL ---
+
+
+class ParallelSearch:
+    """Process pool that splits every iteration's root moves across workers"""
+
+    def __init__(self, workers=None):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.alpha = multiprocessing.Value('d', -math.inf)
+        self.pool = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self.alpha,))
+        self.nodes = 0
+        self.depth_reached = 0
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    def warm_up(self):
+        """Start every worker process now instead of during the first search"""
+        for future in [self.pool.submit(_warm_up) for _ in range(self.workers)]:
+            future.result()
+
+    def search(self, board, ai, max_depth, time_budget_ms=None):
+        """Iterative deepening over the root moves, like AI.iterative_deepening"""
+        start = time.perf_counter()
+        ai_options = {
+            'level': ai.level,
+            'player': ai.player,
+            'evaluator': ai.evaluator,
+            'max_candidates': ai.max_candidates,
+            'tt_size_mb': ai.tt.size * TranspositionTable.ENTRY_BYTES // 2**20,
+            'rows': ai.geometry.rows,
+            'cols': ai.geometry.cols,
+            'win_length': ai.geometry.win_length,
+            'symmetric_tt': ai.symmetric_tt,
+            'weights': ai.weights,
+            'quiescence_nodes': ai.quiescence_nodes,
+            'search': ai.search,
+            'lmr_moves': ai.lmr_moves,
+        }
+        moves = list(board.move_stack)
+        root_moves = ai.get_strategic_moves(board, ai.player, 0)
+        max_depth = min(max_depth, board.size - board.marked_sqrs)
+        self.nodes = 0
+        self.depth_reached = 0
+        best_move = root_moves[0] if root_moves else None
+
+        for depth in range(1, max_depth + 1):
+            # Depth 1 always finishes so there is a move to return
+            deadline = None
+            if time_budget_ms is not None and depth > 1:
+                deadline = start + time_budget_ms / 1000
+
+            self.alpha.value = -math.inf
+            futures = [self.pool.submit(_search_root_move, type(board), moves, ai_options, move, depth, deadline)
+                       for move in root_moves]
+            results = [future.result() for future in futures]
+            self.nodes += sum(nodes for _, _, _, nodes in results)
+            if any(score is None for _, score, _, _ in results):
+                break  # out of time, keep the last completed depth
+
+            # Only scores above the alpha a move was searched with are exact,
+            # the others are upper bounds and lose ties
+            scored = [(score, score > alpha, -i, move) for i, (move, score, alpha, _) in enumerate(results)]
+            scored.sort(reverse=True)
+            best_score, best_move = scored[0][0], scored[0][3]
+            self.depth_reached = depth
+
+            # Search the best moves of this depth first in the next one
+            root_moves = [move for _, _, _, move in scored]
+
+            if abs(best_score) > WIN_SCORE:
+                break  # proven result
+            if time_budget_ms is not None and time.perf_counter() - start > time_budget_ms / 2000:
+                break
+
+        return best_move
+
+# --- BENCHMARK ---
+
+
+def bench(worker_counts, depth, n_positions, seed):
+    from benchmark import random_board
+
+    rng = random.Random(seed)
+    boards = []
+    while len(boards) < n_positions:
+        board = random_board(rng, rng.randint(6, 30))
+        if board.final_state() == 0:
+            boards.append(board)
+
+    baseline = None
+    print(f"{'workers':>7} {'seconds':>8} {'nodes':>9} {'nodes/s':>9} {'speedup':>7}")
+    for workers in worker_counts:
+        search = ParallelSearch(workers)
+        search.warm_up()
+        nodes = 0
+        start = time.perf_counter()
+        for board in boards:
+            player = 1 if board.marked_sqrs % 2 == 0 else 2
+            search.search(board, AI(player=player), depth)
+            nodes += search.nodes
+        seconds = time.perf_counter() - start
+        search.close()
+
+        if baseline is None:
+            baseline = seconds
+        print(f"{workers:>7} {seconds:>8.2f} {nodes:>9} {nodes / seconds:>9.0f} {baseline / seconds:>6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--positions', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    bench(args.workers, args.depth, args.positions, args.seed)
+
+
+if __name__ == "__main__":
+    main()
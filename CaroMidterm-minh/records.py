@@ -0,0 +1,218 @@
+"""Game records: a compact binary log of whole games
+
+    python records.py show games.rec
+    python records.py check games.rec       # replay every game, compare the stored result
+
+A file is a header followed by the games back to back. Each game is a fixed
+record header (board size, win length, AI side and settings), one byte per
+move (row * cols + col, two bytes on boards of 255 squares or more), an end marker
+and the result. Moves are written as they are played, so a game cut short
+by a crash only loses its end marker: the reader skips it, and the next
+GameRecorder on the file ends it as unfinished before adding games.
+"""
+import argparse
+import mmap
+import os
+import struct
+from collections import namedtuple
+from engine import new_board
+
+MAGIC = b'CAROREC\0'
+VERSION = 1
+FILE_HEADER = struct.Struct('<8sH')
+# rows, cols, win length, AI player (0 = two humans or two engines), AI level, max depth, time budget in ms
+GAME_HEADER = struct.Struct('<BBBBBBH')
+
+# Results, stored after the end marker
+UNFINISHED = 0  # 1 and 2 are the winning player
+DRAW = 3
+
+GameRecord = namedtuple('GameRecord', 'rows cols win_length ai_player level depth time_ms cells result')
+
+
+def cell_bytes(rows, cols):
+    """Bytes per move; the all-ones value is the end marker"""
+    return 1 if rows * cols < 0xFF else 2
+
+
+def _end_marker(width):
+    return b'\xff' * width
+
+# --- WRITING ---
+
+
+class GameRecorder:
+    """Appends games to a record file, move by move"""
+
+    def __init__(self, path):
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not new:
+            with open(path, 'rb') as f:
+                magic, version = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a version {VERSION} game record file")
+            _close_last_game(path)
+        self.file = open(path, 'ab')
+        if new:
+            self.file.write(FILE_HEADER.pack(MAGIC, VERSION))
+            self.file.flush()
+        self.width = 0  # bytes per move of the open game, 0 = no game open
+        self.cols = 0
+
+    def begin(self, rows, cols, win_length, ai_player=0, level=0, depth=0, time_ms=0):
+        """Start a game; a game still open is closed as unfinished"""
+        if self.width:
+            self.end(UNFINISHED)
+        self.file.write(GAME_HEADER.pack(rows, cols, win_length, ai_player, level, depth, min(time_ms or 0, 0xFFFF)))
+        self.width = cell_bytes(rows, cols)
+        self.cols = cols
+        self.file.flush()
+
+    def move(self, row, col):
+        self.file.write((row * self.cols + col).to_bytes(self.width, 'little'))
+        self.file.flush()
+
+    def end(self, result):
+        """result: UNFINISHED, DRAW or the winning player"""
+        if not self.width:
+            return
+        self.file.write(_end_marker(self.width) + bytes([result]))
+        self.file.flush()
+        self.width = 0
+
+    def close(self):
+        self.end(UNFINISHED)
+        self.file.close()
+
+# --- READING ---
+
+
+def _games(mm):
+    """(header, offset of its first move, offset of its end marker or None if it has none) of every game"""
+    pos = FILE_HEADER.size
+    size = len(mm)
+    while pos + GAME_HEADER.size <= size:
+        header = GAME_HEADER.unpack_from(mm, pos)
+        width = cell_bytes(header[0], header[1])
+        start = pos + GAME_HEADER.size
+        # The marker can't start inside a two-byte move
+        end = mm.find(_end_marker(width), start)
+        while end != -1 and (end - start) % width:
+            end = mm.find(_end_marker(width), end + 1)
+        if end == -1 or end + width >= size:
+            yield header, start, None
+            return
+        yield header, start, end
+        pos = end + width + 1
+
+
+def _close_last_game(path):
+    """End a game a crash left without its end marker as unfinished, so the next game starts after it"""
+    with open(path, 'r+b') as f:
+        size = os.fstat(f.fileno()).st_size
+        pos = FILE_HEADER.size
+        last = None
+        if size > pos:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for header, start, end in _games(mm):
+                    if end is None:
+                        last = header, start
+                    else:
+                        pos = end + cell_bytes(header[0], header[1]) + 1
+        if last is None:
+            f.truncate(pos)  # nothing, or a game header cut short
+            return
+        (rows, cols, *_), start = last
+        width = cell_bytes(rows, cols)
+        f.seek(start)
+        tail = f.read(size - start)
+        # Keep the whole moves, up to an end marker written without its result
+        end = len(tail) // width * width
+        for i in range(0, end, width):
+            if tail[i:i + width] == _end_marker(width):
+                end = i
+                break
+        f.truncate(start + end)
+        f.seek(start + end)
+        f.write(_end_marker(width) + bytes([UNFINISHED]))
+
+
+def read_games(path):
+    """
+        Yield the finished and unfinished games of a record file one at a time,
+        without reading it whole. A game cut short at the end of the file and a
+        game with a move off its board are skipped
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size <= FILE_HEADER.size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            magic, version = FILE_HEADER.unpack_from(mm)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a version {VERSION} game record file")
+
+            for header, start, end in _games(mm):
+                if end is None:
+                    return
+                record = GameRecord(*header, mm[start:end], mm[end + cell_bytes(header[0], header[1])])
+                # A cell past rows * cols means the bytes aren't a game of this header
+                if all(row < record.rows for row, _ in moves(record)):
+                    yield record
+
+
+def moves(record):
+    """(row, col) of every move of a record, X first"""
+    width = cell_bytes(record.rows, record.cols)
+    cells = record.cells
+    if width == 1:
+        return [divmod(cell, record.cols) for cell in cells]
+    return [divmod(int.from_bytes(cells[i:i + 2], 'little'), record.cols) for i in range(0, len(cells), 2)]
+
+
+def replay(record, backend='array'):
+    """The board of a record after all its moves"""
+    board = new_board(backend, record.rows, record.cols, record.win_length)
+    for ply, (row, col) in enumerate(moves(record)):
+        board.push(row, col, ply % 2 + 1)
+    return board
+
+
+def check(path, backend='array'):
+    """Replay every game and return the number whose board disagrees with the stored result"""
+    mismatches = 0
+    for record in read_games(path):
+        board = replay(record, backend)
+        if record.result == DRAW:
+            expected = board.final_state() == 0 and board.isfull()
+        elif record.result == UNFINISHED:
+            expected = True
+        else:
+            expected = board.final_state() == record.result
+        mismatches += not expected
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    show = commands.add_parser('show', help='print the games of a record file')
+    show.add_argument('path')
+    verify = commands.add_parser('check', help='replay every game and compare the result')
+    verify.add_argument('path')
+    verify.add_argument('--backend', default='array', choices=['array', 'bitboard'])
+
+    args = parser.parse_args()
+    if args.command == 'show':
+        names = {UNFINISHED: 'unfinished', 1: 'X wins', 2: 'O wins', DRAW: 'draw'}
+        for i, record in enumerate(read_games(args.path)):
+            players = 'two players' if not record.ai_player else f"AI plays {'XO'[record.ai_player - 1]}"
+            print(f"game {i}: {record.rows}x{record.cols}, {record.win_length} in a row, {players}, "
+                  f"{names[record.result]}: {' '.join(f'{row}{col}' for row, col in moves(record))}")
+    else:
+        games = sum(1 for _ in read_games(args.path))
+        mismatches = check(args.path, args.backend)
+        print(f"{games} games replayed, {mismatches} disagree with their result")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""AI server for many games at once, and a load generator to measure it
+
+    python server.py serve --port 8765 --workers 4 --max-inflight 64
+    python server.py load --port 8765 --sessions 32 --moves 10 --time 200
+
+The protocol is one JSON object per line in each direction. A request names
+its session, the moves played so far ([row, col], X first) and optionally
+time_ms (search time), depth, deadline_ms (from arrival to answer) and the
+board shape (rows, cols, win_length) on the first request of the session:
+
+    {"id": 1, "session": "g1", "moves": [[4, 4]], "time_ms": 200, "deadline_ms": 1000}
+    {"id": 1, "move": [5, 5], "reason": "search", "depth": 5, "nodes": 8000, "ms": 203.1}
+
+{"id": 2, "session": "g1", "op": "close"} frees the session and
+{"id": 3, "op": "status"} returns the requests served and failed so far.
+Failed requests are answered with {"id": ..., "error": "..."}.
+
+Each session always goes to the same worker process, which keeps its board
+and AIs (and so their transposition tables) between requests. At most
+--max-inflight requests are handled at once; beyond that the server stops
+reading from the sockets and TCP pushes back on the clients.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from constants import AI_MAX_DEPTH, AI_TIME_BUDGET_MS, BOARD_BACKEND, ROWS, COLS, WIN_LENGTH
+from engine import AI, new_board
+
+MAX_SESSIONS = 64  # default sessions kept warm per worker, the least recently used go first
+# Each side of a session has its own AI; these keep one near SESSION_MB of memory once its tables fill
+SESSION_TT_MB = 1
+SESSION_THREAT_CACHE = 10_000
+SESSION_MB = 4
+DEADLINE_MARGIN_MS = 20  # left of a deadline for the answer to get back
+
+# --- WORKERS ---
+
+_sessions = OrderedDict()  # in each worker: session -> {'board': board, 'ais': {player: AI}}
+_max_sessions = MAX_SESSIONS
+
+
+def _init_worker(max_sessions):
+    global _max_sessions
+    _max_sessions = max_sessions
+
+
+def _session_move(session, moves, shape, max_depth, time_ms, deadline):
+    """
+        Search the next move of a session in its worker
+        @return (move, reason, depth, nodes, ms)
+    """
+    budget_ms = min(time_ms, (deadline - time.time()) * 1000 - DEADLINE_MARGIN_MS)
+    if budget_ms <= 0:
+        raise TimeoutError("deadline passed while queued")
+
+    state = _sessions.pop(session, None)
+    rows, cols, win_length = shape
+    if state is None or state['board'].geometry.win_length != win_length or \
+            (state['board'].rows, state['board'].cols) != (rows, cols):
+        state = {'board': new_board(BOARD_BACKEND, rows, cols, win_length), 'ais': {}}
+    _sessions[session] = state
+    while len(_sessions) > _max_sessions:
+        _sessions.popitem(last=False)
+
+    # Continue the session's board if the position extends it, else replay it
+    board = state['board']
+    played = [(row, col) for row, col, _ in board.move_stack]
+    if played != moves[:len(played)]:
+        board = state['board'] = new_board(BOARD_BACKEND, rows, cols, win_length)
+        played = []
+    for ply in range(len(played), len(moves)):
+        row, col = moves[ply]
+        if not (0 <= row < rows and 0 <= col < cols) or not board.empty_sqr(row, col):
+            state['board'] = new_board(BOARD_BACKEND, rows, cols, win_length)
+            raise ValueError(f"illegal move {[row, col]} at ply {ply}")
+        board.push(row, col, ply % 2 + 1)
+    if board.final_state() != 0 or board.isfull():
+        raise ValueError("the game is over")
+
+    # One AI per side, so table scores keep the side they were searched for
+    player = len(moves) % 2 + 1
+    ai = state['ais'].get(player)
+    if ai is None:
+        ai = state['ais'][player] = AI(player=player, rows=rows, cols=cols, win_length=win_length,
+                                       tt_size_mb=SESSION_TT_MB, threat_cache_size=SESSION_THREAT_CACHE)
+    start = time.perf_counter()
+    ai.nodes = ai.depth_reached = 0
+    move, reason = ai.choose_move(board, max_depth, budget_ms)
+    return list(move), reason, ai.depth_reached, ai.nodes, (time.perf_counter() - start) * 1000
+
+
+def _close_session(session):
+    return _sessions.pop(session, None) is not None
+
+# --- SERVER ---
+
+
+class CaroServer:
+    """asyncio front end over one single-process pool per worker"""
+
+    def __init__(self, workers=4, max_inflight=64, time_ms=AI_TIME_BUDGET_MS, deadline_ms=None,
+                 max_sessions=MAX_SESSIONS):
+        # A pool of one process per worker keeps each session on one process
+        self.pools = [ProcessPoolExecutor(1, initializer=_init_worker, initargs=(max_sessions,))
+                      for _ in range(workers)]
+        self.inflight = asyncio.Semaphore(max_inflight)
+        self.time_ms = time_ms
+        self.deadline_ms = deadline_ms  # None = time_ms plus a second
+        self.served = 0
+        self.failed = 0
+
+    def close(self):
+        for pool in self.pools:
+            pool.shutdown(cancel_futures=True)
+
+    def pool_for(self, session):
+        return self.pools[zlib.crc32(session.encode()) % len(self.pools)]
+
+    async def serve(self, host='127.0.0.1', port=8765):
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def handle(self, reader, writer):
+        """Answer the requests of one connection, several at a time, in any order"""
+        write_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                # Backpressure: a full server reads no more requests; an idle connection holds no permit
+                await self.inflight.acquire()
+                task = asyncio.create_task(self.respond(line, writer, write_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, line, writer, write_lock):
+        received = time.time()
+        request = {}
+        try:
+            request = json.loads(line)
+            response = await self.dispatch(request, received)
+            self.served += 1
+        except Exception as e:
+            self.failed += 1
+            response = {'error': str(e) or type(e).__name__}
+        finally:
+            self.inflight.release()
+        response['id'] = request.get('id') if isinstance(request, dict) else None
+
+        async with write_lock:
+            writer.write(json.dumps(response, separators=(',', ':')).encode() + b'\n')
+            await writer.drain()
+
+    async def dispatch(self, request, received):
+        loop = asyncio.get_running_loop()
+        if request.get('op') == 'status':
+            return {'served': self.served, 'failed': self.failed}
+        session = str(request['session'])
+        pool = self.pool_for(session)
+        if request.get('op', 'move') == 'close':
+            closed = await loop.run_in_executor(pool, _close_session, session)
+            return {'closed': closed}
+
+        time_ms = request.get('time_ms') or self.time_ms
+        deadline_ms = request.get('deadline_ms') or self.deadline_ms or time_ms + 1000
+        deadline = received + deadline_ms / 1000
+        moves = [tuple(move) for move in request.get('moves', [])]
+        shape = (request.get('rows', ROWS), request.get('cols', COLS), request.get('win_length', WIN_LENGTH))
+        future = loop.run_in_executor(pool, _session_move, session, moves, shape,
+                                      request.get('depth', AI_MAX_DEPTH), time_ms, deadline)
+        try:
+            # The worker finishes a late search anyway, its answer is dropped
+            move, reason, depth, nodes, ms = await asyncio.wait_for(future, max(deadline - time.time(), 0))
+        except asyncio.TimeoutError:
+            raise TimeoutError("deadline passed") from None
+        return {'move': move, 'reason': reason, 'depth': depth, 'nodes': nodes, 'ms': round(ms, 1)}
+
+# --- LOAD GENERATOR ---
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)] if values else None
+
+
+async def play_session(host, port, session, n_moves, time_ms, deadline_ms, rng, latencies, errors):
+    """A client playing random moves near the stones against the server, one request at a time"""
+    reader, writer = await asyncio.open_connection(host, port)
+    board = new_board()
+    moves = []
+    try:
+        for request_id in range(n_moves):
+            # The client's move: random next to a stone, or near the center
+            squares = [divmod(cell, board.cols) for cell in board.candidates] or list(board.geometry.center_moves)
+            move = rng.choice(squares)
+            board.mark_sqr(*move, len(moves) % 2 + 1)
+            moves.append(move)
+            if board.final_state() != 0 or board.isfull():
+                break
+
+            request = {'id': request_id, 'session': session, 'moves': moves, 'time_ms': time_ms,
+                       'deadline_ms': deadline_ms}
+            start = time.perf_counter()
+            writer.write(json.dumps(request).encode() + b'\n')
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            latencies.append((time.perf_counter() - start) * 1000)
+            if 'error' in response:
+                errors.append(response['error'])
+                break
+
+            board.mark_sqr(*response['move'], len(moves) % 2 + 1)
+            moves.append(tuple(response['move']))
+            if board.final_state() != 0 or board.isfull():
+                break
+
+        writer.write(json.dumps({'id': -1, 'session': session, 'op': 'close'}).encode() + b'\n')
+        await writer.drain()
+        await reader.readline()
+    finally:
+        writer.close()
+
+
+async def load(host='127.0.0.1', port=8765, sessions=32, n_moves=10, time_ms=200, deadline_ms=None, seed=0):
+    """Play sessions games at once and report throughput and latency percentiles"""
+    rng = random.Random(seed)
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(play_session(host, port, f'load-{seed}-{i}', n_moves, time_ms, deadline_ms,
+                                        random.Random(rng.random()), latencies, errors)
+                           for i in range(sessions)))
+    seconds = time.perf_counter() - start
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'seconds': seconds,
+        'requests_per_sec': len(latencies) / seconds,
+        'p50_ms': percentile(latencies, 0.50),
+        'p99_ms': percentile(latencies, 0.99),
+        'max_ms': max(latencies, default=None),
+        'error_counts': {error: errors.count(error) for error in set(errors)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser('serve', help='run the server')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8765)
+    serve.add_argument('--workers', type=int, default=4, help='worker processes')
+    serve.add_argument('--max-inflight', type=int, default=64, help='requests handled at once')
+    serve.add_argument('--time', type=int, default=AI_TIME_BUDGET_MS, help='default search time in ms')
+    serve.add_argument('--max-sessions', type=int, default=None,
+                       help=f'sessions kept warm per worker, default from --memory-mb or {MAX_SESSIONS}')
+    serve.add_argument('--memory-mb', type=int, default=None,
+                       help=f'memory budget per worker, about {2 * SESSION_MB} MB per session')
+
+    client = commands.add_parser('load', help='play games against a running server and time the answers')
+    client.add_argument('--host', default='127.0.0.1')
+    client.add_argument('--port', type=int, default=8765)
+    client.add_argument('--sessions', type=int, default=32, help='games played at once')
+    client.add_argument('--moves', type=int, default=10, help='AI moves requested per game')
+    client.add_argument('--time', type=int, default=200, help='search time per move in ms')
+    client.add_argument('--deadline', type=int, default=None, help='deadline per request in ms')
+    client.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args()
+    if args.command == 'serve':
+        max_sessions = args.max_sessions
+        if max_sessions is None:
+            max_sessions = MAX_SESSIONS if args.memory_mb is None else max(args.memory_mb // (2 * SESSION_MB), 1)
+        server = CaroServer(args.workers, args.max_inflight, args.time, max_sessions=max_sessions)
+        print(f"serving on {args.host}:{args.port} with {args.workers} workers, "
+              f"{max_sessions} warm sessions each")
+        try:
+            asyncio.run(server.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            print(f"{server.served} requests served, {server.failed} failed")
+    else:
+        result = asyncio.run(load(args.host, args.port, args.sessions, args.moves, args.time, args.deadline,
+                                  args.seed))
+        print(f"{result['requests']} requests, {result['errors']} errors in {result['seconds']:.1f}s: "
+              f"{result['requests_per_sec']:.1f} req/s, p50 {result['p50_ms']:.0f} ms, "
+              f"p99 {result['p99_ms']:.0f} ms, max {result['max_ms']:.0f} ms")
+        for error, count in result['error_counts'].items():
+            print(f"{count} x {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+    Opt-in statistics and tracing of one AI move
+
+        move, stats = ai.eval(board, 6, time_budget_ms=500, stats=True)
+        print(stats.summary())
+
+        move, stats = ai.eval(board, 4, trace=True)
+        stats.write_trace('search.json')  # open in ui.perfetto.dev or chrome://tracing
+"""
+import json
+import math
+import time
+from collections import Counter
+
+
+def _finite(value):
+    """JSON has no infinity, alpha and beta start there"""
+    if isinstance(value, float) and math.isinf(value):
+        return None
+    return value
+
+
+class SearchStats:
+    """Counters, timings and optionally the search tree of one AI.eval call
+
+    attach() wraps the AI's minimax, pvs, evaluate_board, get_strategic_moves,
+    record_cutoff and transposition table methods on the instance, detach()
+    removes the wrappers again, so searches without stats run the plain methods.
+    """
+
+    def __init__(self, trace=False, trace_limit=200_000):
+        # 'opening', 'random', 'book', 'win', 'block', 'threat', 'defence', 'search', 'ponder',
+        # 'fallback' or 'stopped'
+        self.reason = None
+        self.move = None
+        self.nodes = 0
+        self.leaves = 0
+        self.cutoffs = 0
+        self.researches = 0  # pvs searches repeated after a null or aspiration window failed
+        self.cutoffs_by_index = Counter()  # position in the move list of the moves that pruned
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.depth_reached = 0
+        self.iterations = []  # (depth, seconds, nodes) per completed iteration
+        self.pv = []
+        self.root_scores = {}  # root move -> score of the last completed iteration, a bound if it was pruned
+        self.seconds = {'total': 0.0, 'evaluate': 0.0, 'move_generation': 0.0, 'transposition': 0.0}
+        self.trace = [] if trace else None  # Chrome trace events, one per minimax or pvs node
+        self.trace_limit = trace_limit
+        self._start = 0.0
+
+    # --- COLLECTING ---
+    def attach(self, ai):
+        clock = time.perf_counter
+        seconds = self.seconds
+        trace = self.trace
+        minimax = ai.minimax
+        pvs = ai.pvs
+        evaluate_board = ai.evaluate_board
+        get_strategic_moves = ai.get_strategic_moves
+        record_cutoff = ai.record_cutoff
+        probe, store = ai.tt.probe, ai.tt.store
+        moves_at = {}  # depth -> move list of the node being searched at that depth
+        root_scores = {}
+
+        def traced(category, search, board, depth, max_depth, alpha, beta, to_ai):
+            """Run one search node, tracing it and keeping the root scores; to_ai turns its score to the AI's view"""
+            nonlocal root_scores
+            if depth == 0:
+                root_scores = {}
+            start = clock()
+            score = None
+            try:
+                score, move = search()
+            finally:
+                if trace is not None and len(trace) < self.trace_limit:
+                    name = f'depth {max_depth}' if depth == 0 else '{},{}'.format(*board.move_stack[-1][:2])
+                    trace.append({
+                        'name': name, 'cat': category, 'ph': 'X', 'pid': 0, 'tid': 0,
+                        'ts': (start - self._start) * 1e6, 'dur': (clock() - start) * 1e6,
+                        'args': {'depth': depth, 'alpha': _finite(alpha), 'beta': _finite(beta), 'score': score},
+                    })
+            if depth == 1:
+                root_scores[board.move_stack[-1][:2]] = to_ai * score
+            elif depth == 0:
+                self.root_scores = root_scores
+            return score, move
+
+        def timed_minimax(board, maximizing, depth, max_depth, alpha=-math.inf, beta=math.inf):
+            return traced('minimax', lambda: minimax(board, maximizing, depth, max_depth, alpha, beta),
+                          board, depth, max_depth, alpha, beta, 1)
+
+        def timed_pvs(board, depth, max_depth, alpha=-math.inf, beta=math.inf):
+            # pvs scores are from the side to move's view, the opponent's at depth 1
+            return traced('pvs', lambda: pvs(board, depth, max_depth, alpha, beta),
+                          board, depth, max_depth, alpha, beta, -1 if depth % 2 else 1)
+
+        def timed_evaluate_board(board):
+            start = clock()
+            score = evaluate_board(board)
+            seconds['evaluate'] += clock() - start
+            return score
+
+        def timed_get_strategic_moves(board, player=None, depth=0):
+            start = clock()
+            moves = get_strategic_moves(board, player, depth)
+            seconds['move_generation'] += clock() - start
+            moves_at[depth] = moves  # reordered in place by minimax before the loop
+            return moves
+
+        def counted_record_cutoff(player, move, depth, max_depth):
+            moves = moves_at.get(depth)
+            if moves is not None and move in moves:
+                self.cutoffs_by_index[moves.index(move)] += 1
+            record_cutoff(player, move, depth, max_depth)
+
+        def timed_probe(key, ply):
+            start = clock()
+            entry = probe(key, ply)
+            seconds['transposition'] += clock() - start
+            self.tt_probes += 1
+            self.tt_hits += entry is not None
+            return entry
+
+        def timed_store(key, ply, depth, flag, score, move):
+            start = clock()
+            store(key, ply, depth, flag, score, move)
+            seconds['transposition'] += clock() - start
+
+        ai.minimax = timed_minimax
+        ai.pvs = timed_pvs
+        ai.evaluate_board = timed_evaluate_board
+        ai.get_strategic_moves = timed_get_strategic_moves
+        ai.record_cutoff = counted_record_cutoff
+        ai.tt.probe = timed_probe
+        ai.tt.store = timed_store
+
+        # Counters of a previous search must not leak into a move without one
+        ai.nodes = ai.leaves = ai.cutoffs = ai.researches = ai.depth_reached = 0
+        ai.iterations = []
+        ai.pv = []
+        self._start = clock()
+
+    def detach(self, ai):
+        self.seconds['total'] = time.perf_counter() - self._start
+        for name in ('minimax', 'pvs', 'evaluate_board', 'get_strategic_moves', 'record_cutoff'):
+            vars(ai).pop(name, None)
+        for name in ('probe', 'store'):
+            vars(ai.tt).pop(name, None)
+
+        self.nodes = ai.nodes
+        self.leaves = ai.leaves
+        self.cutoffs = ai.cutoffs
+        self.researches = ai.researches
+        self.depth_reached = ai.depth_reached
+        self.iterations = list(ai.iterations)
+        self.pv = list(ai.pv)
+
+    # --- REPORTING ---
+    def as_dict(self):
+        return {
+            'reason': self.reason,
+            'move': self.move,
+            'nodes': self.nodes,
+            'leaves': self.leaves,
+            'cutoffs': self.cutoffs,
+            'cutoffs_by_index': dict(sorted(self.cutoffs_by_index.items())),
+            'researches': self.researches,
+            'tt_probes': self.tt_probes,
+            'tt_hits': self.tt_hits,
+            'depth_reached': self.depth_reached,
+            'iterations': self.iterations,
+            'pv': self.pv,
+            'root_scores': {f'{row},{col}': score for (row, col), score in self.root_scores.items()},
+            'seconds': dict(self.seconds),
+        }
+
+    def summary(self):
+        seconds = self.seconds
+        total = seconds['total'] or 1e-9
+        search = total - seconds['evaluate'] - seconds['move_generation'] - seconds['transposition']
+        cutoffs = sum(self.cutoffs_by_index.values())
+        first = self.cutoffs_by_index[0] / cutoffs if cutoffs else 0.0
+        hit_rate = self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+        lines = [
+            f"move {self.move} ({self.reason}), depth {self.depth_reached}, pv {self.pv}",
+            f"{self.nodes} nodes, {self.leaves} leaves, {self.cutoffs} cutoffs "
+            f"({first:.0%} on the first move), {self.researches} re-searches, "
+            f"TT hits {self.tt_hits}/{self.tt_probes} ({hit_rate:.0%})",
+            f"{total * 1000:.1f} ms: evaluate {seconds['evaluate'] / total:.0%}, "
+            f"move generation {seconds['move_generation'] / total:.0%}, "
+            f"transposition {seconds['transposition'] / total:.0%}, rest of the search {search / total:.0%}",
+        ]
+        if self.root_scores:
+            ranked = sorted(self.root_scores.items(), key=lambda item: -math.inf if item[1] is None else item[1],
+                            reverse=True)
+            lines.append('root ' + ', '.join(f'({row},{col})={score}' for (row, col), score in ranked))
+        return '\n'.join(lines)
+
+    def write_trace(self, path):
+        """Write the search tree in the Chrome trace event format"""
+        if self.trace is None:
+            raise ValueError("the search was not traced, pass trace=True to AI.eval")
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.trace, 'displayTimeUnit': 'ms', 'otherData': self.as_dict()}, f)
@@ -0,0 +1,97 @@
+import random
+import numpy as np
+import pytest
+import copy
+from engine import AI, BitBoard, Board, geometry
+
+# (rows, cols, win_length) of the boards the tests play on
+SHAPES = [(10, 10, 5), (15, 15, 5), (3, 3, 3), (6, 7, 4)]
+
+
+def random_games(shape, games=20, seed=0):
+    """Move lists of random games on shape, each played until a win or a full board"""
+    rng = random.Random(seed)
+    rows, cols, win_length = shape
+    for _ in range(games):
+        board = Board(rows, cols, win_length)
+        game = []
+        player = 1
+        while board.final_state() == 0 and not board.isfull():
+            row, col = rng.choice(board.get_empty_sqrs())
+            board.push(row, col, player)
+            game.append((row, col, player))
+            player = 3 - player
+        yield game
+
+
+def board_state(board):
+    """Everything push() changes on a board, copied"""
+    return copy.deepcopy((board.move_stack, board.marked_sqrs, board.last_move, board.winner, board.win_line,
+                          board.win_ply, board.hash, board.symmetric_hashes, board.window_keys, board.eval_scores,
+                          board.candidates, board.near)) + (board.squares.copy(),)
+
+
+def geometry_state(geometry):
+    """The tables of a Geometry that boards read on every push/pop"""
+    return copy.deepcopy((geometry.cell_windows, geometry.neighbours, geometry.zobrist_keys,
+                          geometry.symmetric_keys, geometry.window_cells.tolist(), geometry.center_moves))
+
+
+@pytest.mark.parametrize('shape', SHAPES)
+def test_bitboard_plays_like_board(shape):
+    rows, cols, win_length = shape
+    ai = AI(player=2, tt_size_mb=1, threat_nodes=0, rows=rows, cols=cols, win_length=win_length)
+    for game in random_games(shape):
+        board, bitboard = Board(rows, cols, win_length), BitBoard(rows, cols, win_length)
+        for row, col, player in game:
+            board.push(row, col, player)
+            bitboard.push(row, col, player)
+            assert bitboard.final_state() == board.final_state()
+            assert bitboard.win_line == board.win_line
+            assert np.array_equal(bitboard.squares, board.squares)
+            assert bitboard.get_empty_sqrs() == board.get_empty_sqrs()
+            assert bitboard.candidates == board.candidates
+            assert ai.evaluate_board(bitboard) == ai.evaluate_board(board)
+            assert ai.get_strategic_moves(bitboard) == ai.get_strategic_moves(board)
+
+
+@pytest.mark.parametrize('shape', SHAPES)
+@pytest.mark.parametrize('backend', [Board, BitBoard])
+def test_incremental_evaluation_matches_full_evaluation(shape, backend):
+    rows, cols, win_length = shape
+    ais = [AI(player=player, tt_size_mb=1, threat_nodes=0, rows=rows, cols=cols, win_length=win_length)
+           for player in (1, 2)]
+    for game in random_games(shape, games=3):
+        board = backend(rows, cols, win_length)
+        for row, col, player in game:
+            board.push(row, col, player)
+            for ai in ais:
+                assert ai.evaluate_board(board) == ai.evaluate_board_python(board)
+        # pop() keeps the running score as well
+        while board.move_stack:
+            board.pop()
+            for ai in ais:
+                assert ai.evaluate_board(board) == ai.evaluate_board_python(board)
+
+
+@pytest.mark.parametrize('shape', SHAPES)
+@pytest.mark.parametrize('backend', [Board, BitBoard])
+def test_pop_undoes_push(shape, backend):
+    rows, cols, win_length = shape
+    ai = AI(player=2, tt_size_mb=1, threat_nodes=0, rows=rows, cols=cols, win_length=win_length)
+    shared = geometry(rows, cols, win_length)
+    tables = geometry_state(shared)
+    rng = random.Random(1)
+    for game in random_games(shape, games=5):
+        board = backend(rows, cols, win_length)
+        ai.evaluate_board(board)  # keep the incremental score from the start
+        for row, col, player in game:
+            before = board_state(board)
+            # Any empty square, including the ones that win
+            board.push(*rng.choice(board.get_empty_sqrs()), player)
+            board.pop()
+            after = board_state(board)
+            assert all(np.array_equal(a, b) for a, b in zip(after, before))
+            board.push(row, col, player)
+        assert board.geometry is shared
+    assert geometry_state(shared) == tables
@@ -0,0 +1,38 @@
+from records import DRAW, UNFINISHED, GameRecorder, check, moves, read_games
+
+
+def test_game_cut_short_by_a_crash_is_ended_on_reopen(tmp_path):
+    path = str(tmp_path / 'games.rec')
+    crashed = GameRecorder(path)
+    crashed.begin(10, 10, 5)
+    for row, col in [(4, 4), (5, 5), (4, 5)]:
+        crashed.move(row, col)
+    crashed.file.close()  # no end(), as after a crash
+
+    recorder = GameRecorder(path)
+    recorder.begin(10, 10, 5)
+    recorder.move(0, 0)
+    recorder.move(9, 9)
+    recorder.end(DRAW)
+    recorder.close()
+
+    games = list(read_games(path))
+    assert [(moves(game), game.result) for game in games] == [
+        ([(4, 4), (5, 5), (4, 5)], UNFINISHED),
+        ([(0, 0), (9, 9)], DRAW),
+    ]
+    assert check(path) == 1  # the draw isn't a full board
+
+
+def test_reader_skips_moves_off_the_board(tmp_path):
+    path = str(tmp_path / 'games.rec')
+    recorder = GameRecorder(path)
+    recorder.begin(3, 3, 3)
+    recorder.file.write(bytes([200]))  # cell 200 of a 3x3 board
+    recorder.end(UNFINISHED)
+    recorder.begin(3, 3, 3)
+    recorder.move(1, 1)
+    recorder.end(UNFINISHED)
+    recorder.close()
+
+    assert [moves(game) for game in read_games(path)] == [[(1, 1)]]
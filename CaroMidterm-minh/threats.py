@@ -0,0 +1,292 @@
+"""
+    Threat-space search: forced wins made only of threats
+
+    VCF (victory by continuous fours): every attacker move makes a four, so
+    the defender's reply is forced and the tree is narrow enough to search
+    20+ plies deep. VCT (victory by continuous threats) also plays threes:
+    an attacker move is a threat if the attacker would win by VCF were the
+    defender to pass, and the defender's replies are the squares of that
+    VCF, the squares that turn the attacker's threes into fours and the
+    defender's own fours. VCF wins are exact, VCT wins are as good as that
+    choice of replies.
+"""
+import time
+from collections import Counter
+
+# Results of ThreatSolver.solve
+NO_WIN = 0  # the attacker has no forced win
+WIN = 1  # the line is a forced win
+UNKNOWN = 2  # the node budget, the deadline or the depth limit ran out first
+
+
+# --- BOARD SCANS ---
+
+
+def _squares(board, target):
+    """Empty squares of the windows whose key is target, most shared first"""
+    keys = board.window_keys
+    if target not in keys:
+        return []
+    window_squares = board.geometry.window_squares
+    counts = Counter()
+    window = keys.index(target)
+    while True:
+        for square in window_squares[window]:
+            if board.empty_sqr(*square):
+                counts[square] += 1
+        # list.index finds the few matching windows faster than a loop over all of them
+        try:
+            window = keys.index(target, window + 1)
+        except ValueError:
+            return [square for square, _ in counts.most_common()]
+
+
+def _target(board, player, stones):
+    """Window key of a window with stones of player's and none of the opponent's"""
+    return stones * (1 if player == 1 else board.geometry.key_base)
+
+
+def wins(board, player):
+    """Squares that complete a line for player"""
+    return _squares(board, _target(board, player, board.geometry.win_length - 1))
+
+
+def fours(board, player):
+    """Squares that leave player one move from a line"""
+    return _squares(board, _target(board, player, board.geometry.win_length - 2))
+
+
+def threats(board, player):
+    """Fours, then squares that make threes"""
+    moves = fours(board, player)
+    if board.geometry.win_length > 3:
+        moves += [move for move in _squares(board, _target(board, player, board.geometry.win_length - 3))
+                  if move not in moves]
+    return moves
+
+
+def defences(board, attacker, threat):
+    """Replies to an attacker threat whose VCF line, were the defender to pass, is threat"""
+    defender = 3 - attacker
+    moves = list(dict.fromkeys(threat))
+    for move in fours(board, attacker) + fours(board, defender):
+        if move not in moves:
+            moves.append(move)
+    return moves
+
+
+def open_fours(board, player):
+    """Squares of fours that leave player two ways to complete a line, which one move can't both block"""
+    target = _target(board, player, board.geometry.win_length - 2)
+    keys = board.window_keys
+    if target not in keys:
+        return []
+    geometry = board.geometry
+    existing = set(wins(board, player))
+    moves = []
+    for move in _squares(board, target):
+        # The empty squares left in the windows the move turns into fours
+        finishing = set(existing)
+        for window in geometry.cell_windows[move[0] * board.cols + move[1]]:
+            if keys[window] == target:
+                finishing.update(square for square in geometry.window_squares[window]
+                                 if square != move and board.empty_sqr(*square))
+        if len(finishing) > 1:
+            moves.append(move)
+    return moves
+
+
+class _OutOfBudget(Exception):
+    pass
+
+
+class ThreatSolver:
+    """VCF/VCT search with a node budget and a cache kept between calls"""
+
+    def __init__(self, node_budget=3000, vcf_depth=25, vct_depth=5, cache_size=1_000_000, stop_event=None):
+        self.node_budget = node_budget
+        self.vcf_depth = vcf_depth  # plies of fours and forced replies
+        self.vct_depth = vct_depth  # plies in which threes may be played as well
+        self.cache = {}  # (hash, attacker, kind) -> (line or None, plies left, complete)
+        self.cache_size = cache_size
+        self.deadline = None  # perf_counter() time the running solve must stop at
+        self.stop_event = stop_event  # threading.Event ending the solve when set
+        self.nodes = 0
+        self.cut = 0  # depth cutoffs in the current solve, a result under one is no proof
+
+    # --- SEARCH ---
+    def _count(self):
+        self.nodes += 1
+        if self.nodes > self.node_budget:
+            raise _OutOfBudget
+        if self.nodes & 31 == 0 and (self.deadline is not None and time.perf_counter() > self.deadline or
+                                     self.stop_event is not None and self.stop_event.is_set()):
+            raise _OutOfBudget
+
+    def _cached(self, key, left):
+        entry = self.cache.get(key)
+        if entry is None:
+            return False, None
+        line, searched, complete = entry
+        if line is not None:
+            return True, line
+        if searched >= left:
+            if not complete:
+                self.cut += 1
+            return True, None
+        return False, None
+
+    def _store(self, key, line, left, cut):
+        self.cache[key] = (line, left, self.cut == cut)
+
+    def _vcf(self, board, attacker, ply):
+        """Winning line of fours with attacker to move, or None"""
+        self._count()
+        fives = wins(board, attacker)
+        if fives:
+            return [fives[0]]
+        left = self.vcf_depth - ply
+        if left <= 0:
+            self.cut += 1
+            return None
+
+        key = (board.hash, attacker, 'vcf')
+        found, line = self._cached(key, left)
+        if found:
+            return line
+        cut = self.cut
+
+        defender = 3 - attacker
+        blocks = wins(board, defender)
+        line = None
+        if len(blocks) < 2:
+            for move in fours(board, attacker):
+                # A four elsewhere loses to the defender's five
+                if blocks and move != blocks[0]:
+                    continue
+                board.push(*move, attacker)
+                replies = wins(board, attacker)
+                if len(replies) > 1:
+                    line = [move]  # two fours, only one can be blocked
+                elif replies:
+                    board.push(*replies[0], defender)
+                    # The block may complete a line of the defender's
+                    rest = None if board.winner else self._vcf(board, attacker, ply + 2)
+                    board.pop()
+                    if rest is not None:
+                        line = [move, replies[0]] + rest
+                board.pop()
+                if line is not None:
+                    break
+
+        self._store(key, line, left, cut)
+        return line
+
+    def _vct(self, board, attacker, ply):
+        """Winning line of threats with attacker to move, or None"""
+        self._count()
+        fives = wins(board, attacker)
+        if fives:
+            return [fives[0]]
+        line = self._vcf(board, attacker, ply)
+        if line is not None:
+            return line
+        left = self.vct_depth - ply
+        if left <= 0:
+            self.cut += 1
+            return None
+
+        key = (board.hash, attacker, 'vct')
+        found, line = self._cached(key, left)
+        if found:
+            return line
+        cut = self.cut
+
+        defender = 3 - attacker
+        blocks = wins(board, defender)
+        line = None
+        if len(blocks) < 2:
+            for move in threats(board, attacker):
+                if blocks and move != blocks[0]:
+                    continue
+                board.push(*move, attacker)
+                rest = self._refute(board, attacker, ply + 1)
+                board.pop()
+                if rest is not None:
+                    line = [move] + rest
+                    break
+
+        self._store(key, line, left, cut)
+        return line
+
+    def _refute(self, board, attacker, ply):
+        """The attacker's line if every defence to the threat just played loses, or None"""
+        self._count()
+        defender = 3 - attacker
+        fives = wins(board, attacker)
+        if len(fives) > 1:
+            return []
+        if fives:
+            replies = fives  # anything else loses at once
+        else:
+            threat = self._vcf(board, attacker, ply + 1)  # as if the defender passed
+            if threat is None:
+                return None
+            replies = defences(board, attacker, threat)
+
+        line = None
+        for move in replies:
+            board.push(*move, defender)
+            rest = None if board.winner else self._vct(board, attacker, ply + 1)
+            board.pop()
+            if rest is None:
+                return None
+            if line is None:
+                line = [move] + rest
+        return line
+
+    def solve(self, board, attacker, vct=True, deadline=None):
+        """
+            Search for a forced win of attacker, who is to move, until the node
+            budget or the perf_counter() deadline runs out
+            @return (WIN, line of moves from here), (NO_WIN, None) or (UNKNOWN, None)
+        """
+        self.deadline = deadline
+        self.nodes = 0
+        self.cut = 0
+        if len(self.cache) > self.cache_size:
+            self.cache.clear()
+
+        stack_size = len(board.move_stack)
+        try:
+            line = self._vct(board, attacker, 0) if vct else self._vcf(board, attacker, 0)
+        except _OutOfBudget:
+            while len(board.move_stack) > stack_size:
+                board.pop()
+            return UNKNOWN, None
+
+        if line is not None:
+            return WIN, line
+        return (NO_WIN if self.cut == 0 else UNKNOWN), None
+
+    def defence(self, board, player, order=()):
+        """
+            A move for player, who is to move, after which the opponent has no
+            VCF, if the opponent has one now; moves in order are tried first
+            @return None if there is no VCF to stop or nothing stops it
+        """
+        opponent = 3 - player
+        result, line = self.solve(board, opponent, vct=False)
+        if result != WIN:
+            return None
+
+        moves = defences(board, opponent, line)
+        rank = {move: i for i, move in enumerate(order)}
+        moves.sort(key=lambda move: rank.get(move, len(rank)))
+        for move in moves:
+            board.push(*move, player)
+            result, _ = self.solve(board, opponent, vct=False)
+            board.pop()
+            if result == NO_WIN:
+                return move
+        return None
@@ -0,0 +1,125 @@
+import random
+from functools import lru_cache
+import numpy as np
+from constants import COLS
+
+# --- ZOBRIST KEYS ---
+
+# Fixed seed so hashes are the same in every process and every run
+ZOBRIST_SEED = 0xCA20
+
+_rng = random.Random(ZOBRIST_SEED)
+
+# SIDE_KEYS[ai_player][maximizing] - scores depend on who searches and who moves
+SIDE_KEYS = [[_rng.getrandbits(64) for _ in range(2)] for _ in range(3)]
+
+
+@lru_cache(maxsize=None)
+def zobrist_keys(rows, cols):
+    """keys[player][row][col] of a rows x cols board, index 0 is unused (empty square)"""
+    rng = random.Random(f'{ZOBRIST_SEED}:{rows}x{cols}')
+    keys = [[[rng.getrandbits(64) for _ in range(cols)] for _ in range(rows)] for _ in range(3)]
+    keys[0] = [[0] * cols for _ in range(rows)]
+    return keys
+
+# --- TRANSPOSITION TABLE ---
+
+# Bound types
+EXACT = 0
+LOWER = 1  # score is at least this (fail high)
+UPPER = 2  # score is at most this (fail low)
+
+# Scores beyond this are wins/losses that carry their distance from the root
+WIN_SCORE = 9000
+
+
+class TranspositionTable:
+    """Fixed-size table of search results keyed by Zobrist hash
+
+    Every bucket has two slots: slot 0 keeps the deepest search stored
+    for the bucket and slot 1 is always overwritten by the latest store.
+    """
+
+    # key (8) + score (4) + move (2) + depth (1) + flag (1)
+    ENTRY_BYTES = 16
+
+    def __init__(self, size_mb=16, cols=COLS):
+        self.cols = cols  # moves are stored as row * cols + col
+        n_buckets = max(1, size_mb * 2**20 // (2 * self.ENTRY_BYTES))
+        n_buckets = 1 << (n_buckets.bit_length() - 1)  # power of two for masking
+        self.mask = n_buckets - 1
+        self.size = 2 * n_buckets  # number of entries
+
+        self.keys = np.zeros(self.size, dtype=np.uint64)
+        self.scores = np.zeros(self.size, dtype=np.int32)
+        self.moves = np.full(self.size, -1, dtype=np.int16)
+        self.depths = np.full(self.size, -1, dtype=np.int8)  # -1 = empty slot
+        self.flags = np.zeros(self.size, dtype=np.int8)
+
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0  # misses where the bucket held other positions
+        self.stores = 0
+
+    def clear(self):
+        self.keys.fill(0)
+        self.depths.fill(-1)
+        self.moves.fill(-1)
+        self.hits = self.misses = self.collisions = self.stores = 0
+
+    def probe(self, key, ply):
+        """
+            @return (depth, flag, score, move) if the position is stored
+            @return None otherwise
+        """
+        i = (key & self.mask) << 1
+        keys = self.keys
+        if keys[i] != key or self.depths[i] < 0:
+            i += 1
+            if keys[i] != key or self.depths[i] < 0:
+                self.misses += 1
+                if self.depths[i - 1] >= 0 or self.depths[i] >= 0:
+                    self.collisions += 1
+                return None
+
+        self.hits += 1
+        score = int(self.scores[i])
+        # Stored wins/losses are relative to the node, make them relative to the root
+        if score > WIN_SCORE:
+            score -= ply
+        elif score < -WIN_SCORE:
+            score += ply
+
+        move = int(self.moves[i])
+        move = divmod(move, self.cols) if move >= 0 else None
+        return int(self.depths[i]), int(self.flags[i]), score, move
+
+    def store(self, key, ply, depth, flag, score, move):
+        i = (key & self.mask) << 1
+        # Keep the deeper search in slot 0, anything else goes to slot 1
+        if self.keys[i] != key and depth < self.depths[i]:
+            i += 1
+
+        if score > WIN_SCORE:
+            score += ply
+        elif score < -WIN_SCORE:
+            score -= ply
+
+        self.keys[i] = key
+        self.scores[i] = score
+        self.moves[i] = move[0] * self.cols + move[1] if move is not None else -1
+        self.depths[i] = depth
+        self.flags[i] = flag
+        self.stores += 1
+
+    def stats(self):
+        probes = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'collisions': self.collisions,
+            'stores': self.stores,
+            'hit_rate': self.hits / probes if probes else 0.0,
+            'filled': int(np.count_nonzero(self.depths >= 0)),
+            'size': self.size,
+        }
@@ -0,0 +1,162 @@
+"""Texel tuning of the evaluation weights on recorded games
+
+    python arena.py --games 400 --a depth=3,time=0 --b depth=3,time=0 --out selfplay.rec
+    python tune.py selfplay.rec games.rec --out eval_weights.json
+
+Every position of a finished game is labelled with the game's result for X
+(1, 1/2, 0). The evaluation is linear in the weights, so each position is
+reduced once to its feature counts: windows holding win_length - 3, - 2
+and - 1 stones of X and none of O, minus the same for O, and X's center
+stones minus O's. The tuner fits K of sigmoid(K * eval) to the current
+weights, then minimizes the mean squared error of the predicted results
+with Adam over all positions, in NumPy batches.
+"""
+import argparse
+import json
+import time
+import numpy as np
+from engine import DEFAULT_WEIGHTS, load_weights
+from records import DRAW, UNFINISHED, read_games, replay
+
+TUNED = 3  # window weights fitted, the win_length weight only scores finished games
+
+
+def game_positions(record, skip):
+    """Feature rows of the positions of one game, from ply skip on"""
+    board = replay(record)
+    geometry = board.geometry
+    k, base = geometry.win_length, geometry.key_base
+    # X-only and O-only window keys of each feature
+    x_keys = np.array([k - 3, k - 2, k - 1])
+    o_keys = base * x_keys
+    center = geometry.center_cells
+
+    rows = []
+    while len(board.move_stack) > skip:
+        keys = np.bincount(board.window_keys, minlength=base * base)
+        stones = board.squares.ravel()[center]
+        rows.append(np.append(keys[x_keys] - keys[o_keys], np.count_nonzero(stones == 1) - np.count_nonzero(stones == 2)))
+        board.pop()
+    return rows
+
+
+def load_positions(paths, skip=4, batch=65536):
+    """
+        Features and X's results of every position of the finished games in paths
+        @return (features: int32 array of shape (n, TUNED + 1), results: float array of shape (n,))
+    """
+    features, results = [], []
+    chunk, chunk_results = [], []
+    for path in paths:
+        for record in read_games(path):
+            if record.result == UNFINISHED:
+                continue
+            score = 0.5 if record.result == DRAW else float(record.result == 1)
+            rows = game_positions(record, skip)
+            chunk.extend(rows)
+            chunk_results.extend([score] * len(rows))
+            # Stack in batches so the Python lists stay small
+            if len(chunk) >= batch:
+                features.append(np.array(chunk, dtype=np.int32))
+                results.append(np.array(chunk_results))
+                chunk, chunk_results = [], []
+    if chunk:
+        features.append(np.array(chunk, dtype=np.int32))
+        results.append(np.array(chunk_results))
+    if not features:
+        return np.zeros((0, TUNED + 1), dtype=np.int32), np.zeros(0)
+    return np.concatenate(features), np.concatenate(results)
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-np.clip(x, -50, 50)))
+
+
+def vector(weights):
+    return np.array(weights['window'][:TUNED] + [weights['center']], dtype=np.float64)
+
+
+def loss(features, results, w, k, batch=1 << 20):
+    """Mean squared error of sigmoid(k * eval) against the results"""
+    total = 0.0
+    for start in range(0, len(results), batch):
+        predicted = sigmoid(k * (features[start:start + batch] @ w))
+        total += np.sum((results[start:start + batch] - predicted) ** 2)
+    return total / len(results)
+
+
+def fit_k(features, results, w):
+    """K of the sigmoid that makes the current weights predict best, by golden section in log space"""
+    lo, hi = np.log(1e-5), np.log(1.0)
+    ratio = (np.sqrt(5) - 1) / 2
+    for _ in range(60):
+        a, b = hi - ratio * (hi - lo), lo + ratio * (hi - lo)
+        if loss(features, results, w, np.exp(a)) < loss(features, results, w, np.exp(b)):
+            hi = b
+        else:
+            lo = a
+    return float(np.exp((lo + hi) / 2))
+
+
+def tune(features, results, weights=DEFAULT_WEIGHTS, epochs=500, lr=0.02, batch=1 << 20):
+    """
+        Fit the weights to the results with Adam on their scale relative to the start
+        @return (new weights, K, loss before, loss after)
+    """
+    w0 = vector(weights)
+    k = fit_k(features, results, w0)
+    before = loss(features, results, w0, k)
+
+    # Adam on u with w = w0 * u, so weights of very different sizes move alike
+    u = np.ones_like(w0)
+    m = np.zeros_like(w0)
+    v = np.zeros_like(w0)
+    for epoch in range(1, epochs + 1):
+        gradient = np.zeros_like(w0)
+        w = w0 * u
+        for start in range(0, len(results), batch):
+            x = features[start:start + batch]
+            predicted = sigmoid(k * (x @ w))
+            error = predicted - results[start:start + batch]
+            gradient += (error * predicted * (1 - predicted)) @ x
+        gradient *= 2 * k * w0 / len(results)
+        m = 0.9 * m + 0.1 * gradient
+        v = 0.999 * v + 0.001 * gradient ** 2
+        u -= lr * (m / (1 - 0.9 ** epoch)) / (np.sqrt(v / (1 - 0.999 ** epoch)) + 1e-12)
+        u = np.maximum(u, 0.0)  # a threat is never worth less than nothing
+
+    w = w0 * u
+    after = loss(features, results, w, k)
+    tuned = {'window': [int(round(x)) for x in w[:TUNED]] + weights['window'][TUNED:], 'center': int(round(w[TUNED]))}
+    return tuned, k, before, after
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('records', nargs='+', help='game record files (records.py)')
+    parser.add_argument('--start', default='', help='weights file to start from, default the built-in weights')
+    parser.add_argument('--skip', type=int, default=4, help='opening plies left out')
+    parser.add_argument('--epochs', type=int, default=500)
+    parser.add_argument('--lr', type=float, default=0.02)
+    parser.add_argument('--out', default=None, help='write the tuned weights here (JSON)')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    features, results = load_positions(args.records, args.skip)
+    if not len(results):
+        parser.error("no finished games in the record files")
+    print(f"{len(results)} positions in {time.perf_counter() - start:.1f}s, X scored {results.mean():.3f}")
+
+    weights = load_weights(args.start)
+    start = time.perf_counter()
+    tuned, k, before, after = tune(features, results, weights, args.epochs, args.lr)
+    print(f"K = {k:.5f}, mean squared error {before:.5f} -> {after:.5f} in {time.perf_counter() - start:.1f}s")
+    print(f"window {weights['window']} -> {tuned['window']}, center {weights['center']} -> {tuned['center']}")
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(tuned, f, indent=1)
+        print(f"weights written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()